@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -17,3 +17,44 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def create_indexes():
+    """create_all skips the indexes of tables that already exist, create them here"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def add_missing_columns():
+    """create_all does not alter existing tables, add the columns introduced since"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+
+
+def enable_incremental_vacuum():
+    """
+    switch the database to incremental auto vacuum so pages freed by the retention
+    deletes can be returned to the filesystem a few at a time. the mode of an existing
+    database only changes after a full VACUUM, which runs once here.
+    """
+    autocommit = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    with autocommit as connection:
+        mode = connection.execute(text("PRAGMA auto_vacuum")).scalar()
+        if mode == 2:
+            return
+        connection.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        connection.execute(text("VACUUM"))
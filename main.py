@@ -1,13 +1,37 @@
 import asyncio
 import sys
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 from routers.student import router as student_router
 from routers.llm import router as llm_router
+from routers.admin import router as admin_router
 import models
-from database import engine
-from utils.validator import cleanup_sessions
+from database import (
+    engine,
+    add_missing_columns,
+    create_indexes,
+    enable_incremental_vacuum,
+)
+from utils.validator import (
+    checkpoint_sessions,
+    close_sessions,
+    expire_sessions,
+    purge_expired_sessions,
+    restore_sessions,
+    session_store,
+)
+from utils.cache import cache
+from utils.retention import evict_stale_students
+from utils.main import backfill_course_index
+from utils.compression import CompressionMiddleware
+from utils.captcha_pool import captcha_pool
+from utils.keepalive import keepalive, track_active
+from utils.refresher import refresher
+from utils.scheduler import scrape_scheduler
+from utils.circuit_breaker import CircuitOpenError, vtop_breaker
+from utils.timeouts import vtop_latency
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,8 +51,14 @@ async def lifespan(app: FastAPI):
     logger.info("Starting application...")
 
     try:
+        enable_incremental_vacuum()
         models.Base.metadata.create_all(bind=engine)
+        add_missing_columns()
+        create_indexes()
         logger.info("Database tables created successfully")
+        backfilled = backfill_course_index()
+        if backfilled:
+            logger.info(f"Indexed the stored timetables of {backfilled} students")
     except Exception as e:
         logger.error(f"Failed to create database tables: {e}")
         raise
@@ -36,7 +66,8 @@ async def lifespan(app: FastAPI):
     async def periodic_cleanup():
         while True:
             try:
-                await cleanup_sessions()
+                await purge_expired_sessions()
+                await evict_stale_students()
                 logger.debug("Periodic cleanup completed")
             except Exception as e:
                 logger.error(f"Cleanup task failed: {e}")
@@ -45,6 +76,30 @@ async def lifespan(app: FastAPI):
     cleanup_task = asyncio.create_task(periodic_cleanup())
     logger.info("Periodic cleanup task started")
 
+    await restore_sessions()
+
+    expiry_task = asyncio.create_task(expire_sessions())
+    logger.info("Session expiry task started")
+
+    checkpoint_task = asyncio.create_task(checkpoint_sessions())
+
+    keepalive_task = None
+    if keepalive.enabled:
+        track_active(keepalive)
+        keepalive_task = asyncio.create_task(keepalive.run())
+        logger.info(f"Session keepalive every {keepalive.interval}s started")
+
+    refresher_task = None
+    if refresher.enabled:
+        track_active(refresher)
+        refresher_task = asyncio.create_task(refresher.run())
+        logger.info(f"Student refresh every {refresher.interval}s started")
+
+    captcha_task = None
+    if captcha_pool.enabled:
+        captcha_task = asyncio.create_task(captcha_pool.run())
+        logger.info(f"Captcha pool of {captcha_pool.size} started")
+
     yield
 
     logger.info("Shutting down application...")
@@ -56,6 +111,46 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Error during cleanup task shutdown: {e}")
 
+    expiry_task.cancel()
+    try:
+        await expiry_task
+    except asyncio.CancelledError:
+        logger.info("Session expiry task cancelled successfully")
+
+    checkpoint_task.cancel()
+    try:
+        await checkpoint_task
+    except asyncio.CancelledError:
+        pass
+
+    if captcha_task is not None:
+        captcha_task.cancel()
+        try:
+            await captcha_task
+        except asyncio.CancelledError:
+            pass
+        await captcha_pool.close()
+
+    if refresher_task is not None:
+        refresher_task.cancel()
+        try:
+            await refresher_task
+        except asyncio.CancelledError:
+            pass
+        await refresher.close()
+
+    if keepalive_task is not None:
+        keepalive_task.cancel()
+        try:
+            await keepalive_task
+        except asyncio.CancelledError:
+            pass
+        await keepalive.close()
+
+    await close_sessions()
+
+    await cache.close()
+
 
 app = FastAPI(
     title="VTOP API",
@@ -64,13 +159,35 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(CompressionMiddleware)
+
 app.include_router(router=student_router, prefix="/student", tags=["students"])
 app.include_router(router=llm_router, prefix="/llm", tags=["llm"])
+app.include_router(router=admin_router, prefix="/admin", tags=["admin"])
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)},
+    )
 
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "cache": cache.stats(),
+        "sessions": session_store.stats(),
+        "captcha_pool": captcha_pool.stats(),
+        "keepalive": keepalive.stats(),
+        "refresher": refresher.stats(),
+        "scrape_scheduler": scrape_scheduler.stats(),
+        "vtop_breaker": vtop_breaker.stats(),
+        "vtop_latency": vtop_latency.stats(),
+    }
 
 
 if __name__ == "__main__":
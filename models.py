@@ -1,6 +1,20 @@
-from sqlalchemy import Column, String
+from sqlalchemy import Column, DateTime, Float, Index, LargeBinary, String
 from database import Base
 
+# json sections scraped from vtop, one column each in the students table
+STUDENT_SECTIONS = (
+    "profile",
+    "semester",
+    "timetable",
+    "marks",
+    "grade_history",
+    "attendance",
+    "cgpa_details",
+    "grades_count",
+    "credits_info",
+    "attendance_analytics",
+)
+
 
 class Student(Base):
     __tablename__ = "students"
@@ -15,3 +29,80 @@ class Student(Base):
     cgpa_details = Column(String)
     grades_count = Column(String)
     credits_info = Column(String)
+    attendance_analytics = Column(String)
+    # naive utc time of the last scrape that wrote a section
+    updated_at = Column(DateTime, index=True)
+
+
+class SectionETag(Base):
+    """strong etag of every stored section, computed when the section is written"""
+
+    __tablename__ = "section_etags"
+
+    reg_no = Column(String, primary_key=True)
+    section = Column(String, primary_key=True)
+    etag = Column(String, nullable=False)
+
+
+class CompressedSection(Base):
+    """response envelope of a section compressed at scrape time, one row per encoding"""
+
+    __tablename__ = "compressed_sections"
+
+    reg_no = Column(String, primary_key=True)
+    section = Column(String, primary_key=True)
+    encoding = Column(String, primary_key=True)
+    body = Column(LargeBinary, nullable=False)
+
+
+class StudentCourse(Base):
+    """courses a student registered per semester, indexed from the timetable at scrape time"""
+
+    __tablename__ = "student_courses"
+    # cross student lookups : who is registered in a course in a semester,
+    # reg_no is included so pages are read in index order
+    __table_args__ = (
+        Index("ix_student_courses_course", "course_code", "sem_id", "reg_no"),
+    )
+
+    reg_no = Column(String, primary_key=True)
+    sem_id = Column(String, primary_key=True)
+    course_code = Column(String, primary_key=True)
+    course_name = Column(String)
+    credit = Column(String)
+    faculty = Column(String)
+    slot = Column(String)
+    venue = Column(String)
+
+
+class EmptyPage(Base):
+    """semester page of a student vtop answered with nothing, skipped until it is stale"""
+
+    __tablename__ = "empty_pages"
+
+    reg_no = Column(String, primary_key=True)
+    # attendance / marks / gpa
+    page = Column(String, primary_key=True)
+    sem_id = Column(String, primary_key=True)
+    # naive utc time the page was last found empty
+    checked_at = Column(DateTime, nullable=False)
+
+
+class VtopSession(Base):
+    """vtop cookie jar and csrf token of a login session, shared by every worker"""
+
+    __tablename__ = "vtop_sessions"
+
+    reg_no = Column(String, primary_key=True)
+    cookies = Column(String, nullable=False)
+    csrf = Column(String)
+    # base64 jpeg of the captcha of the pending login
+    captcha = Column(String)
+    # created / active (logged in) / expired (dropped by vtop)
+    status = Column(String)
+    # unix time the session expires at
+    deadline = Column(Float, nullable=False, index=True)
+
+
+# tables holding rows of a student, keyed by reg_no
+STUDENT_TABLES = (Student, SectionETag, CompressedSection, StudentCourse, EmptyPage)
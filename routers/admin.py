@@ -0,0 +1,123 @@
+import logging
+import os
+import secrets
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from models import STUDENT_SECTIONS, StudentCourse
+from database import get_db
+from utils.export import export_students
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """admin endpoints expose every student's data, guard them with ADMIN_API_KEY"""
+    admin_key = os.getenv("ADMIN_API_KEY", None)
+    if not admin_key:
+        logger.error("ADMIN_API_KEY environment variable is not set")
+        raise HTTPException(503, "admin api is not configured")
+    if not secrets.compare_digest(x_admin_key or "", admin_key):
+        logger.warning("rejected admin request with an invalid key")
+        raise HTTPException(403, "invalid admin key")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+class CourseStudentModel(BaseModel):
+    reg_no: str
+    sem_id: str
+    slot: str | None
+    faculty: str | None
+
+
+class CourseStudentsModel(BaseModel):
+    success: bool
+    course_code: str
+    sem_id: str
+    students: list[CourseStudentModel]
+    next_cursor: str | None = None
+
+
+@router.get("/courses/{course_code}/students", response_model=CourseStudentsModel)
+async def get_course_students(
+    course_code: str,
+    sem_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Returns the students registered in a course in a semester, ordered by reg_no.
+    pass the returned next_cursor back as cursor to read the next page.
+    served from the course index (course_code, sem_id), no timetable is decoded.
+    """
+    try:
+        stmt = (
+            select(
+                StudentCourse.reg_no,
+                StudentCourse.sem_id,
+                StudentCourse.slot,
+                StudentCourse.faculty,
+            )
+            .where(
+                StudentCourse.course_code == course_code,
+                StudentCourse.sem_id == sem_id,
+            )
+            .order_by(StudentCourse.reg_no)
+            .limit(limit + 1)
+        )
+        if cursor:
+            stmt = stmt.where(StudentCourse.reg_no > cursor)
+
+        rows = db.execute(stmt).all()
+        next_cursor = rows[limit - 1].reg_no if len(rows) > limit else None
+
+        logger.info(f"fetched {len(rows[:limit])} students of {course_code}")
+        return CourseStudentsModel(
+            success=True,
+            course_code=course_code,
+            sem_id=sem_id,
+            students=[CourseStudentModel(**row._mapping) for row in rows[:limit]],
+            next_cursor=next_cursor,
+        )
+    except Exception as e:
+        logger.error(f"Error in get_course_students: {e}", exc_info=True)
+        raise HTTPException(500, detail="Error in fetching course students")
+
+
+@router.get("/export")
+async def export_student_records(
+    sections: Optional[list[str]] = Query(None),
+    updated_since: Optional[datetime] = None,
+    compress: bool = False,
+):
+    """
+    Streams every student row as ndjson, one {"reg_no", "updated_at", <sections>} per line.
+    sections : subset of the stored sections, repeat for several (default: all)
+    updated_since : only rows scraped at or after this ISO timestamp (UTC if no offset)
+    compress : gzip the stream, served as students.ndjson.gz
+    rows are read in keyset pages, each on its own short session, memory stays flat
+    with the table size and a slow client does not block the scrapes writing.
+    """
+    requested = list(dict.fromkeys(sections or STUDENT_SECTIONS))
+    unknown = [section for section in requested if section not in STUDENT_SECTIONS]
+    if unknown:
+        raise HTTPException(400, f"unknown sections : {unknown}")
+
+    logger.info(f"exporting sections {requested} updated since {updated_since}")
+    filename = "students.ndjson.gz" if compress else "students.ndjson"
+    return StreamingResponse(
+        export_students(requested, updated_since, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,60 +1,284 @@
 import json
 import logging
 from typing import Optional
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from sqlalchemy import Select, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from sqlalchemy import Select, and_, func, select
 from sqlalchemy.orm import Session
 
-from models import Student
+from models import CompressedSection, SectionETag, Student, StudentCourse
 from database import get_db
+from utils.cache import cache
+from utils.compression import choose_encoding, envelope, strip_encoding
+from utils.cgpa_simulator import build_grade_table, simulate
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+# sections served whole by fetch_all_records
+ALL_RECORD_SECTIONS = (
+    "profile",
+    "semester",
+    "grade_history",
+    "credits_info",
+    "grades_count",
+)
+
+# sections keyed by sem_id, served by fetch_records_per_semester
+PER_SEMESTER_SECTIONS = (
+    "marks",
+    "cgpa_details",
+    "timetable",
+    "attendance",
+    "attendance_analytics",
+)
+
+BUNDLE_SECTIONS = ALL_RECORD_SECTIONS + PER_SEMESTER_SECTIONS
+
+
 class ResponseModel(BaseModel):
     success: bool
     data: dict | None | float
 
 
-async def fetch_all_records(reg_no: str, db: Session, query: str) -> ResponseModel:
+class CgpaSimulateModel(BaseModel):
+    reg_no: str
+    sem_id: str | None = None
+    # every scenario maps course_code -> hypothetical grade
+    scenarios: list[dict[str, str]] = Field(min_length=1, max_length=1000)
+
+
+# stored values that decode to an empty payload
+EMPTY_RECORDS = ("null", "{}")
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def response_etag(
+    etag: str | None, sem_id: str | None = None, encoding: str | None = None
+) -> str | None:
+    """strong etag of a whole section, or of one semester of it, per encoding"""
+    if not etag:
+        return None
+    if sem_id:
+        etag = f"{etag}.{sem_id}"
+    if encoding:
+        etag = f"{etag}-{encoding}"
+    return f'"{etag}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """the encoding suffix is ignored, every encoding of a representation matches"""
+    if not if_none_match or not etag:
+        return False
+    etag = strip_encoding(etag)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == "*" or strip_encoding(candidate) == etag:
+            return True
+    return False
+
+
+def response_headers(etag: str | None, encoding: str | None = None) -> dict:
+    headers = {"Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=response_headers(etag))
+
+
+def raw_response(data: str, etag: str | None = None) -> Response:
+    """
+    wrap the json string stored in the database into the {success, data} envelope
+    without decoding it, the stored value is already valid json.
+    """
+    return Response(
+        content=envelope(data),
+        media_type="application/json",
+        headers=response_headers(etag),
+    )
+
+
+def cache_section(query: str, encoding: str | None) -> str:
+    return f"{query}.{encoding}" if encoding else query
+
+
+async def cached_response(
+    reg_no: str,
+    query: str,
+    sem_id: str | None,
+    if_none_match: str | None,
+    encoding: str | None = None,
+) -> Response | None:
+    """
+    return the cached response for (reg_no, query, sem_id) if present,
+    cached values are stored as b"<etag>\n<body>".
+    """
+    value = await cache.get((reg_no, cache_section(query, encoding), sem_id))
+    if value is None:
+        return None
+    etag, _, body = value.partition(b"\n")
+    etag = etag.decode() or None
+    if etag_matches(if_none_match, etag):
+        logger.info(f"{query} not modified")
+        return not_modified(etag)
+    logger.info(f"{query} served from cache")
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=response_headers(etag, encoding),
+    )
+
+
+async def cache_response(
+    reg_no: str,
+    query: str,
+    sem_id: str | None,
+    response: Response,
+    encoding: str | None = None,
+) -> None:
+    etag = response.headers.get("etag", "")
+    await cache.set(
+        (reg_no, cache_section(query, encoding), sem_id),
+        etag.encode() + b"\n" + response.body,
+    )
+
+
+def select_etag(db: Session, reg_no: str, query: str) -> str | None:
+    """read the etag computed at scrape time, without loading the section itself"""
+    return db.execute(
+        select(SectionETag.etag).where(
+            SectionETag.reg_no == reg_no, SectionETag.section == query
+        )
+    ).scalar_one_or_none()
+
+
+def select_section(
+    db: Session, reg_no: str, query: str
+) -> tuple[str | None, str | None]:
+    """read the stored json of a section together with its etag"""
+    stmt = (
+        select(getattr(Student, query), SectionETag.etag)
+        .outerjoin(
+            SectionETag,
+            and_(SectionETag.reg_no == Student.reg_no, SectionETag.section == query),
+        )
+        .where(Student.reg_no == reg_no)
+    )
+    row = db.execute(stmt).one_or_none()
+    if row is None:
+        return None, None
+    return row[0], row[1]
+
+
+async def fetch_compressed(
+    reg_no: str, db: Session, query: str, encoding: str, if_none_match: str | None
+) -> Response | None:
+    """
+    serve the response envelope of a whole section compressed at scrape time,
+    returns None when no compressed body is stored for the encoding.
+    """
+    cached = await cached_response(reg_no, query, None, if_none_match, encoding)
+    if cached is not None:
+        return cached
+
+    if if_none_match:
+        etag = response_etag(select_etag(db, reg_no, query), encoding=encoding)
+        if etag_matches(if_none_match, etag):
+            logger.info(f"{query} not modified")
+            return not_modified(etag)
+
+    stmt = (
+        select(CompressedSection.body, SectionETag.etag)
+        .outerjoin(
+            SectionETag,
+            and_(
+                SectionETag.reg_no == CompressedSection.reg_no,
+                SectionETag.section == CompressedSection.section,
+            ),
+        )
+        .where(
+            CompressedSection.reg_no == reg_no,
+            CompressedSection.section == query,
+            CompressedSection.encoding == encoding,
+        )
+    )
+    row = db.execute(stmt).one_or_none()
+    if row is None:
+        return None
+
+    body, etag = row
+    logger.info(f"{query} served {encoding} compressed from database")
+    response = Response(
+        content=body,
+        media_type="application/json",
+        headers=response_headers(response_etag(etag, encoding=encoding), encoding),
+    )
+    await cache_response(reg_no, query, None, response, encoding)
+    return response
+
+
+async def negotiate_compressed(
+    reg_no: str,
+    db: Session,
+    query: str,
+    if_none_match: str | None,
+    accept_encoding: str | None,
+) -> Response | None:
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return None
+    try:
+        return await fetch_compressed(reg_no, db, query, encoding, if_none_match)
+    except Exception as e:
+        logger.error(f"error in getting compressed {query} : {str(e)}", exc_info=True)
+        return None
+
+
+async def fetch_all_records(
+    reg_no: str,
+    db: Session,
+    query: str,
+    if_none_match: str | None = None,
+    accept_encoding: str | None = None,
+) -> ResponseModel | Response:
     """
     return the record based on the query provided
-    query : [ "profile", "semester", "grade_history"]
+    query : [ "profile", "semester", "grade_history", "credits_info", "grades_count" ]
+    answers 304 when if_none_match matches the etag stored at scrape time, and
+    serves the body compressed at scrape time when accept_encoding allows it.
     """
+    compressed = await negotiate_compressed(
+        reg_no, db, query, if_none_match, accept_encoding
+    )
+    if compressed is not None:
+        return compressed
+
+    cached = await cached_response(reg_no, query, None, if_none_match)
+    if cached is not None:
+        return cached
+
     data = None
+    etag = None
     try:
-        if query == "profile":
-            logger.info("fetching profile")
-            stmt = select(Student.profile).where(Student.reg_no == reg_no)
-            result = db.execute(stmt)
-            data = result.scalar_one_or_none()
-
-        elif query == "semester":
-            logger.info("fetching semester")
-            stmt = select(Student.semester).where(Student.reg_no == reg_no)
-            result = db.execute(stmt)
-            data = result.scalar_one_or_none()
-
-        elif query == "grade_history":
-            logger.info("fetching grade_history")
-            stmt = select(Student.grade_history).where(Student.reg_no == reg_no)
-            result = db.execute(stmt)
-            data = result.scalar_one_or_none()
-
-        elif query == "credits_info":
-            logger.info("fetching credits_info")
-            stmt = select(Student.credits_info).where(Student.reg_no == reg_no)
-            result = db.execute(stmt)
-            data = result.scalar_one_or_none()
-
-        elif query == "grades_count":
-            logger.info("fetching grades_count")
-            stmt = select(Student.grades_count).where(Student.reg_no == reg_no)
-            result = db.execute(stmt)
-            data = result.scalar_one_or_none()
+        if query in ALL_RECORD_SECTIONS:
+            if if_none_match:
+                etag = response_etag(select_etag(db, reg_no, query))
+                if etag_matches(if_none_match, etag):
+                    logger.info(f"{query} not modified")
+                    return not_modified(etag)
+
+            logger.info(f"fetching {query}")
+            data, stored_etag = select_section(db, reg_no, query)
+            etag = response_etag(stored_etag)
 
     except Exception as e:
         logger.error(f"error in getting {query} : {str(e)}", exc_info=True)
@@ -63,45 +287,63 @@ async def fetch_all_records(reg_no: str, db: Session, query: str) -> ResponseMod
         logger.error(f"record does not exist")
         return ResponseModel(success=False, data=None)
     logger.info(f"{query} data successfully fetched from database")
-    return ResponseModel(success=True, data=json.loads(data))
+    response = raw_response(data, etag)
+    await cache_response(reg_no, query, None, response)
+    return response
 
 
 async def fetch_records_per_semester(
-    reg_no: str, sem_id: str | None, db: Session, query: str
-) -> ResponseModel:
+    reg_no: str,
+    sem_id: str | None,
+    db: Session,
+    query: str,
+    if_none_match: str | None = None,
+    accept_encoding: str | None = None,
+) -> ResponseModel | Response:
     """
     return the student record semester wise if not provided return records for all semester
+    records for all semester are passed through as stored, without decoding, or
+    compressed at scrape time when accept_encoding allows it.
+    answers 304 when if_none_match matches the etag stored at scrape time.
     """
+    sem_id = sem_id or None
+    if not sem_id:
+        compressed = await negotiate_compressed(
+            reg_no, db, query, if_none_match, accept_encoding
+        )
+        if compressed is not None:
+            return compressed
+
+    cached = await cached_response(reg_no, query, sem_id, if_none_match)
+    if cached is not None:
+        return cached
+
     response = None
     data = None
+    etag = None
     try:
-        if query == "marks":
-            logger.info("fetching marks from database")
-            data = db.execute(
-                select(Student.marks).where(Student.reg_no == reg_no)
-            ).scalar_one_or_none()
-
-        elif query == "cgpa_details":
-            logger.info("fetching cgpa_details from database")
-            data = db.execute(
-                select(Student.cgpa_details).where(Student.reg_no == reg_no)
-            ).scalar_one_or_none()
-
-        elif query == "timetable":
-            logger.info("fetching timetable from database")
-            data = db.execute(
-                select(Student.timetable).where(Student.reg_no == reg_no)
-            ).scalar_one_or_none()
-        elif query == "attendance":
-            logger.info("fetching attendance from database")
-            data = db.execute(
-                select(Student.attendance).where(Student.reg_no == reg_no)
-            ).scalar_one_or_none()
+        if query in PER_SEMESTER_SECTIONS:
+            if if_none_match:
+                etag = response_etag(select_etag(db, reg_no, query), sem_id)
+                if etag_matches(if_none_match, etag):
+                    logger.info(f"{query} not modified")
+                    return not_modified(etag)
+
+            logger.info(f"fetching {query} from database")
+            data, stored_etag = select_section(db, reg_no, query)
+            etag = response_etag(stored_etag, sem_id)
+
         if not data:
             logger.error("record does not exist")
             return ResponseModel(success=False, data=None)
         if not sem_id:
-            response = json.loads(data)
+            if data in EMPTY_RECORDS:
+                logger.error("record does not exist")
+                return ResponseModel(success=False, data=None)
+            logger.info(f"{query} data successfully fetched from database")
+            response = raw_response(data, etag)
+            await cache_response(reg_no, query, None, response)
+            return response
         else:
             try:
                 response = json.loads(data)[sem_id]
@@ -117,49 +359,86 @@ async def fetch_records_per_semester(
         logger.error("record does not exist")
         return ResponseModel(success=False, data=None)
     logger.info(f"{query} data successfully fetched from database")
-    return ResponseModel(success=True, data=response)
+    semester_response = raw_response(json.dumps(response), etag)
+    await cache_response(reg_no, query, sem_id, semester_response)
+    return semester_response
 
 
 @router.get("/semesters", response_model=ResponseModel)
-async def get_semesters(reg_no: str, db: Session = Depends(get_db)):
+async def get_semesters(
+    reg_no: str,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
     try:
-        return await fetch_all_records(reg_no, db, "semester")
+        return await fetch_all_records(
+            reg_no, db, "semester", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_semesters: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)  # changed: added error return
 
 
 @router.get("/profile", response_model=ResponseModel)
-async def get_profile(reg_no, db: Session = Depends(get_db)):
+async def get_profile(
+    reg_no,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
     try:
-        return await fetch_all_records(reg_no, db, "profile")
+        return await fetch_all_records(
+            reg_no, db, "profile", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_profile: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)  # changed: added error return
 
 
 @router.get("/grade_history", response_model=ResponseModel)
-async def get_grade_history(reg_no, db: Session = Depends(get_db)):
+async def get_grade_history(
+    reg_no,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
     try:
-        return await fetch_all_records(reg_no, db, "grade_history")
+        return await fetch_all_records(
+            reg_no, db, "grade_history", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_grade_history: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)  # changed: added error return
 
 
 @router.get("/grades_count", response_model=ResponseModel)
-async def get_grades_count(reg_no, db: Session = Depends(get_db)):
+async def get_grades_count(
+    reg_no,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
     try:
-        return await fetch_all_records(reg_no, db, "grades_count")
+        return await fetch_all_records(
+            reg_no, db, "grades_count", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_grades_count: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)
 
 
 @router.get("/credits_info", response_model=ResponseModel)
-async def get_credits_info(reg_no, db: Session = Depends(get_db)):
+async def get_credits_info(
+    reg_no,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
     try:
-        return await fetch_all_records(reg_no, db, "credits_info")
+        return await fetch_all_records(
+            reg_no, db, "credits_info", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_credits_info: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)
@@ -167,10 +446,16 @@ async def get_credits_info(reg_no, db: Session = Depends(get_db)):
 
 @router.get("/cgpa_details", response_model=ResponseModel)
 async def get_cgpa_details(
-    reg_no: str, sem_id: Optional[str] = None, db: Session = Depends(get_db)
+    reg_no: str,
+    sem_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
 ):
     try:
-        return await fetch_records_per_semester(reg_no, sem_id, db, "cgpa_details")
+        return await fetch_records_per_semester(
+            reg_no, sem_id, db, "cgpa_details", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in cgpa_details: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)  # changed: added error return
@@ -178,10 +463,16 @@ async def get_cgpa_details(
 
 @router.get("/marks", response_model=ResponseModel)
 async def get_marks(
-    reg_no: str, sem_id: Optional[str] = None, db: Session = Depends(get_db)
+    reg_no: str,
+    sem_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
 ):
     try:
-        return await fetch_records_per_semester(reg_no, sem_id, db, "marks")
+        return await fetch_records_per_semester(
+            reg_no, sem_id, db, "marks", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in marks: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)
@@ -189,10 +480,16 @@ async def get_marks(
 
 @router.get("/attendance", response_model=ResponseModel)
 async def get_attendance(
-    reg_no: str, sem_id: Optional[str] = None, db: Session = Depends(get_db)
+    reg_no: str,
+    sem_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
 ):
     try:
-        return await fetch_records_per_semester(reg_no, sem_id, db, "attendance")
+        return await fetch_records_per_semester(
+            reg_no, sem_id, db, "attendance", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_attendance: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)  # changed: added error return
@@ -200,48 +497,190 @@ async def get_attendance(
 
 @router.get("/timetable", response_model=ResponseModel)
 async def get_timetable(
-    reg_no: str, sem_id: Optional[str] = None, db: Session = Depends(get_db)
+    reg_no: str,
+    sem_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
 ):
     try:
-        return await fetch_records_per_semester(reg_no, sem_id, db, "timetable")
+        return await fetch_records_per_semester(
+            reg_no, sem_id, db, "timetable", if_none_match, accept_encoding
+        )
     except Exception as e:
         logger.error(f"Error in get_timetable: {e}", exc_info=True)
         return ResponseModel(success=False, data=None)
 
 
+@router.get("/attendance_analytics", response_model=ResponseModel)
+async def get_attendance_analytics(
+    reg_no: str,
+    sem_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    attendance numbers computed at scrape time : typed attended / total classes,
+    classes needed to reach ATTENDANCE_THRESHOLD, classes that can be skipped,
+    and a summary per semester.
+    """
+    try:
+        return await fetch_records_per_semester(
+            reg_no, sem_id, db, "attendance_analytics", if_none_match, accept_encoding
+        )
+    except Exception as e:
+        logger.error(f"Error in get_attendance_analytics: {e}", exc_info=True)
+        return ResponseModel(success=False, data=None)
+
+
+async def get_grade_table(reg_no: str, sem_id: str | None, db: Session) -> dict | None:
+    """
+    credit weighted grade points of the student for the simulator, built from the
+    grade history and the course index, cached until the next scrape.
+    sem_id defaults to the latest semester in the course index.
+    """
+    if not sem_id:
+        sem_id = db.execute(
+            select(func.max(StudentCourse.sem_id)).where(StudentCourse.reg_no == reg_no)
+        ).scalar_one_or_none()
+        if not sem_id:
+            return None
+
+    key = (reg_no, "grade_table", sem_id)
+    cached = await cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    grade_history = db.execute(
+        select(Student.grade_history).where(Student.reg_no == reg_no)
+    ).scalar_one_or_none()
+    current_courses = dict(
+        db.execute(
+            select(StudentCourse.course_code, StudentCourse.credit).where(
+                StudentCourse.reg_no == reg_no, StudentCourse.sem_id == sem_id
+            )
+        ).all()
+    )
+    if not grade_history and not current_courses:
+        return None
+
+    table = build_grade_table(
+        json.loads(grade_history) if grade_history else {}, current_courses, sem_id
+    )
+    await cache.set(key, json.dumps(table).encode())
+    return table
+
+
+@router.post("/cgpa_simulate", response_model=ResponseModel)
+async def cgpa_simulate(
+    simulate_request: CgpaSimulateModel, db: Session = Depends(get_db)
+):
+    """
+    Returns the projected semester gpa and cgpa for every scenario of hypothetical
+    grades of the current semester courses, in the order the scenarios were sent.
+    """
+    try:
+        table = await get_grade_table(
+            simulate_request.reg_no, simulate_request.sem_id, db
+        )
+        if table is None:
+            logger.error("grade history and course index do not exist")
+            return ResponseModel(success=False, data=None)
+
+        results = simulate(table, simulate_request.scenarios)
+        logger.info(f"simulated {len(results)} cgpa scenarios")
+        return ResponseModel(
+            success=True,
+            data={
+                "sem_id": table["sem_id"],
+                "courses": dict(zip(table["codes"], table["credits"])),
+                "results": results,
+            },
+        )
+    except Exception as e:
+        logger.error(f"Error in cgpa_simulate: {e}", exc_info=True)
+        return ResponseModel(success=False, data=None)
+
+
+@router.get("/bundle", response_model=ResponseModel)
+async def get_bundle(
+    reg_no: str,
+    sections: Optional[list[str]] = Query(None),
+    sem_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Returns several sections in one response, read with a single SELECT.
+    sections defaults to every section, sem_id narrows the per semester sections
+    (marks, cgpa_details, timetable, attendance, attendance_analytics) and is ignored
+    by the others.
+    whole sections are spliced into the response as stored, without decoding.
+    """
+    sections = list(dict.fromkeys(sections or BUNDLE_SECTIONS))
+    unknown = [section for section in sections if section not in BUNDLE_SECTIONS]
+    if unknown:
+        logger.error(f"unknown sections requested in bundle : {unknown}")
+        raise HTTPException(400, detail=f"unknown sections : {unknown}")
+
+    try:
+        stmt = select(*[getattr(Student, section) for section in sections]).where(
+            Student.reg_no == reg_no
+        )
+        row = db.execute(stmt).one_or_none()
+        if row is None:
+            logger.error("record does not exist")
+            return ResponseModel(success=False, data=None)
+
+        parts = []
+        for section, data in zip(sections, row):
+            if data and sem_id and section in PER_SEMESTER_SECTIONS:
+                data = json.dumps((json.loads(data) or {}).get(sem_id))
+            parts.append(json.dumps(section) + ":" + (data or "null"))
+
+        logger.info(f"bundle {sections} successfully fetched from database")
+        return raw_response("{" + ",".join(parts) + "}")
+
+    except Exception as e:
+        logger.error(f"Error in get_bundle: {e}", exc_info=True)
+        return ResponseModel(success=False, data=None)
+
+
 @router.get("/courses", response_model=ResponseModel)
-async def get_courses(reg_no: str, db: Session = Depends(get_db)):
+async def get_courses(
+    reg_no: str, sem_id: Optional[str] = None, db: Session = Depends(get_db)
+):
     """
-    Returns a JSON of all course keys and their names for the given reg_no.
-    Use marks like process, but from that resp just puck id n name
+    Returns a JSON of all course keys with their name, credit, faculty and the
+    semesters they were taken in, for the given reg_no, optionally for one sem_id.
+    read from the course index built from the timetable at scrape time.
     """
     try:
-        stmt = select(Student.timetable).where(Student.reg_no == reg_no)
-        result = db.execute(stmt)
-        timetable_data = result.scalar_one_or_none()
-        if not timetable_data:
-            logger.error("timetable does not exist.")
+        stmt = select(StudentCourse).where(StudentCourse.reg_no == reg_no)
+        if sem_id:
+            stmt = stmt.where(StudentCourse.sem_id == sem_id)
+        # latest semester first, its credit and faculty win
+        rows = db.execute(stmt.order_by(StudentCourse.sem_id.desc())).scalars().all()
+
+        if not rows:
+            logger.error("course index does not exist.")
             return ResponseModel(
                 success=False,
                 data={"msg": "timetable does not exist. load data again."},
             )
 
-        data = json.loads(timetable_data)
-
         course_mappings = {}
-
-        for _, sem_data in data.items():
-            for _, timetable in sem_data.items():
-                for period in timetable:
-                    c_code = period.get("course_code", "")
-                    c_name = period.get("course_name", "")
-
-                    if not c_code or not c_name:
-                        continue
-
-                    else:
-                        if c_code not in course_mappings:
-                            course_mappings[c_code] = c_name
+        for row in rows:
+            course = course_mappings.setdefault(
+                row.course_code,
+                {
+                    "course_name": row.course_name,
+                    "credit": row.credit,
+                    "faculty": row.faculty,
+                    "semesters": [],
+                },
+            )
+            course["semesters"].append(row.sem_id)
 
         logger.info("Courses data successfully fetched from database")
         return ResponseModel(success=True, data=course_mappings)
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
+import hashlib
 import logging
+from typing import Optional
 from pydantic import BaseModel
 import httpx
 from sqlalchemy import delete
@@ -9,13 +11,27 @@ from sqlalchemy.orm import Session
 import models
 from utils.scrape import login_scrape as sc
 from utils.main import VtopScraper
+from utils.cache import cache
 from utils.validator import (
     get_client,
     get_csrf,
     store_csrf,
     validate_session,
     store_client,
+    make_client,
+    store_captcha,
+    get_captcha,
+    get_session_status,
+    set_session_status,
+    session_store,
+    ACTIVE,
 )
+from utils.keepalive import keepalive
+from utils.refresher import refresher
+from utils.scheduler import INTERACTIVE, scrape_scheduler
+from utils.prelogin import BASE_URL, PreloginError, captcha_jpeg, fetch_prelogin
+from utils.captcha_pool import captcha_pool
+from utils.circuit_breaker import CircuitOpenError
 
 from database import get_db
 
@@ -36,6 +52,12 @@ class LoginModel(BaseModel):
     response_captcha: str
 
 
+class SessionStatusResponseModel(BaseModel):
+    success: bool
+    status: str | None
+    expires_in: int | None = None
+
+
 class PreLoginResponseModel(BaseModel):
     success: bool
     image_code: str | None
@@ -62,9 +84,10 @@ class AskModel(BaseModel):
     dummy: bool = False
 
 
-async def scrape_user_data(reg_no: str):
+async def scrape_user_data(reg_no: str, recheck_empty: bool = False):
     """
     call the main vtopScrapper calls method scrape() which holds the logic of scraping the data.
+    semester pages found empty by an earlier scrape are skipped unless recheck_empty is set.
     """
     client = await get_client(reg_no)
     if client is None:
@@ -76,9 +99,16 @@ async def scrape_user_data(reg_no: str):
     db = next(db_gen)
 
     try:
-        scrape = VtopScraper(client, reg_no, csrf_token, db)
+        scrape = VtopScraper(client, reg_no, csrf_token, db, recheck_empty)
         logger.info("Starting scrape for user: %s", reg_no)
-        return await scrape.scrape_all()
+        async with session_store.hold(client):
+            name = await scrape_scheduler.run(
+                INTERACTIVE, scrape.scrape_all, keep_session=refresher.enabled
+            )
+        refresher.track(reg_no)
+        return name
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error in scrape_user_data: {e}", exc_info=True)
         raise HTTPException(500, "Internal server error during scraping")
@@ -89,19 +119,10 @@ async def scrape_user_data(reg_no: str):
             pass
 
 
-BASE_URL = "https://vtopcc.vit.ac.in"
-
-
 @router.get("/create_session")
 async def create_session(reg_no: str):
     try:
-        timeout = httpx.Timeout(
-            connect=10.0,  # Connection timeout
-            read=30.0,  # Read timeout (increase this)
-            write=10.0,  # Write timeout
-            pool=10.0,  # Pool timeout
-        )
-        client = httpx.AsyncClient(verify=False, follow_redirects=True, timeout=timeout)
+        client = make_client()
         await store_client(reg_no, client)
         logger.info("Session created for reg_no: %s", reg_no)
         return {
@@ -114,7 +135,12 @@ async def create_session(reg_no: str):
 
 
 @router.post("/prepare_login", response_model=PreLoginResponseModel)
-async def prepare_vtop_login(reg_no: str):
+async def prepare_vtop_login(reg_no: str, include_image: bool = True):
+    """
+    walk the session to the vtop login form and return its captcha.
+    with include_image=false the base64 image_code is left out, fetch the raw jpeg
+    from /captcha instead.
+    """
     try:
         await validate_session(reg_no)
         client = await get_client(reg_no)
@@ -123,49 +149,63 @@ async def prepare_vtop_login(reg_no: str):
             logger.error("Client does not exist for reg_no: %s", reg_no)
             raise HTTPException(500, "client does not exist")
 
-        open_page_url = f"{BASE_URL}/vtop/open/page"
-        attempt = 3
-        image_code = None
-
-        while attempt != 0:
-            logger.info("Attempting to get image captcha, attempts left: %d", attempt)
-            response = await client.get(url=open_page_url)
-            response.raise_for_status()
-
-            csrf_token = sc.extract_csrf_from_open_page(response.text)
+        prelogin = await captcha_pool.take() if captcha_pool.enabled else None
 
-            if csrf_token is None:
-                logger.error("Failed to get CSRF token")
-                raise ValueError("error in getting the csrf token")
-
-            await store_csrf(reg_no, csrf_token)
+        if prelogin is not None:
+            # the pre-warmed client carries the prelogin cookies, it replaces the new one
+            logger.info("Using a pre-warmed captcha for reg_no: %s", reg_no)
+            await store_client(reg_no, prelogin.client)
+            csrf_token, image_code = prelogin.csrf, prelogin.image_code
+        else:
+            try:
+                csrf_token, image_code = await fetch_prelogin(client)
+            except PreloginError:
+                raise HTTPException(400, detail="failed to retrive image recaptcha")
 
-            prelogin_payload = {"_csrf": csrf_token, "flag": "VTOP"}
-            prelogin_url = f"{BASE_URL}/vtop/prelogin/setup"
+        await store_csrf(reg_no, csrf_token)
+        await store_captcha(reg_no, captcha_jpeg(image_code))
 
-            response = await client.post(
-                url=prelogin_url,
-                data=prelogin_payload,
-                follow_redirects=True,
-            )
-            response.raise_for_status()
+        return PreLoginResponseModel(
+            success=True, image_code=image_code if include_image else None
+        )
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error in prepare_vtop_login: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"{e}")
 
-            is_image, image_code = sc.extract_image_recaptcha(response.text)
 
-            if is_image:
-                logger.info("Image captcha retrieved successfully")
-                break
+@router.get("/captcha")
+async def get_captcha_image(reg_no: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Returns the captcha of the pending login as raw image/jpeg bytes, a third smaller
+    than the base64 image_code of /prepare_login. the etag changes with every new
+    captcha, so clients can revalidate with If-None-Match.
+    """
+    image = await get_captcha(reg_no)
+    if image is None:
+        logger.error("Captcha does not exist for reg_no: %s", reg_no)
+        raise HTTPException(404, "captcha does not exist, call prepare_login first")
 
-            attempt -= 1
+    etag = f'"{hashlib.blake2b(image, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image, media_type="image/jpeg", headers=headers)
 
-        if attempt == 0:
-            logger.error("Failed to retrieve image recaptcha after 3 attempts")
-            raise HTTPException(400, detail="failed to retrive image recaptcha")
 
-        return PreLoginResponseModel(success=True, image_code=image_code)
-    except Exception as e:
-        logger.error(f"Error in prepare_vtop_login: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"{e}")
+@router.get("/session_status", response_model=SessionStatusResponseModel)
+async def session_status(reg_no: str):
+    """
+    status of the session : created, active (logged in) or expired (dropped by vtop,
+    found by the keepalive), and the seconds left before it times out.
+    """
+    status = await get_session_status(reg_no)
+    if status is None:
+        return SessionStatusResponseModel(success=False, status=None)
+    return SessionStatusResponseModel(
+        success=True, status=status[0], expires_in=int(status[1])
+    )
 
 
 @router.post("/login", response_model=LoginResponseModel)
@@ -226,6 +266,8 @@ async def login(login_request: LoginModel):
                 raise ValueError("csrf token does not exist")
 
             await store_csrf(login_request.reg_no, csrf_token)
+            await set_session_status(login_request.reg_no, ACTIVE)
+            keepalive.track(login_request.reg_no)
 
             return LoginResponseModel(success=True)
 
@@ -234,13 +276,20 @@ async def login(login_request: LoginModel):
             success=False, message="unexpected error in login"
         )  # changed: typo fixed in message
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error in login endpoint: {e}", exc_info=True)
         raise HTTPException(500, detail="error in requests")
 
 
 @router.get("/start-scraping", response_model=ScrapeResponseModel)
-async def scrape(reg_no: str, force_scrape: bool = True, db: Session = Depends(get_db)):
+async def scrape(
+    reg_no: str,
+    force_scrape: bool = True,
+    recheck_empty: bool = False,
+    db: Session = Depends(get_db),
+):
     try:
         await validate_session(reg_no)
 
@@ -256,21 +305,30 @@ async def scrape(reg_no: str, force_scrape: bool = True, db: Session = Depends(g
                 return ScrapeResponseModel(success=True, name=name)
 
         # Proceed with scraping
-        name = await scrape_user_data(reg_no)
+        name = await scrape_user_data(reg_no, recheck_empty)
         logger.info("Scraping completed for reg_no: %s", reg_no)
         return ScrapeResponseModel(success=True, name=name)
 
+    except HTTPException as e:
+        # missing / expired sessions reach the client as 401, not as a scrape error
+        if e.status_code == 401:
+            raise
+        logger.error(f"Error in scrape endpoint: {e}", exc_info=True)
+        raise HTTPException(500, detail="Error in scraping")
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error in scrape endpoint: {e}", exc_info=True)
         raise HTTPException(500, detail="Error in scraping")
 
 
-@router.get("/logout", response_model=ScrapeResponseModel)
+@router.get("/logout", response_model=LogoutResponseModel)
 async def logout(reg_no: str, db: Session = Depends(get_db)):
     try:
-        stmt = delete(models.Student).where(models.Student.reg_no == reg_no)
-        db.execute(stmt)
+        for table in models.STUDENT_TABLES:
+            db.execute(delete(table).where(table.reg_no == reg_no))
         db.commit()
+        await cache.invalidate(reg_no)
         logger.info("successfully logout and all data is removed")
         return LogoutResponseModel(success=True)
     except Exception as e:
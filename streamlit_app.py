@@ -39,12 +39,16 @@ if st.session_state["session_created"]:
         try:
             response = requests.post(
                 f"{API_BASE}/student/prepare_login",
-                params={"reg_no": st.session_state["reg_no"]},
+                params={"reg_no": st.session_state["reg_no"], "include_image": False},
             )
             if response.status_code == 200:
                 data = response.json()
-                if data["success"]:
-                    st.session_state["captcha_img"] = data["image_code"]
+                captcha = requests.get(
+                    f"{API_BASE}/student/captcha",
+                    params={"reg_no": st.session_state["reg_no"]},
+                )
+                if data["success"] and captcha.ok:
+                    st.session_state["captcha_img"] = captcha.content
                     st.success("Captcha loaded!")
                     st.rerun()
                 else:
@@ -77,13 +81,26 @@ if st.session_state["session_created"]:
                 st.error(f"Login failed: {msg}")
 
 
+if "etag_cache" not in st.session_state:
+    st.session_state["etag_cache"] = {}
+
+
 # After login, allow access to LLM endpoints
 def fetch_api(path, params=None):
     url = f"{API_BASE}{path}"
+    cache_key = (path, tuple(sorted((params or {}).items())))
+    cached = st.session_state["etag_cache"].get(cache_key)
+    headers = {"If-None-Match": cached[0]} if cached else {}
     try:
-        res = requests.get(url, params=params, timeout=60)
+        res = requests.get(url, params=params, headers=headers, timeout=60)
+        if res.status_code == 304 and cached:
+            return cached[1]
         res.raise_for_status()
-        return res.json()
+        data = res.json()
+        etag = res.headers.get("ETag")
+        if etag:
+            st.session_state["etag_cache"][cache_key] = (etag, data)
+        return data
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
 
@@ -211,5 +228,6 @@ if st.session_state["logged_in"]:
         st.session_state["session_created"] = False
         st.session_state["captcha_img"] = None
         st.session_state["sem_list"] = []
+        st.session_state["etag_cache"] = {}
         st.success("Logged out and data deleted.")
         st.rerun()
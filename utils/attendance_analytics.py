@@ -0,0 +1,118 @@
+import math
+import os
+from fractions import Fraction
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# attendance percentage students have to keep in every course
+ATTENDANCE_THRESHOLD = float(os.getenv("ATTENDANCE_THRESHOLD", "75"))
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def analyse_semester(
+    courses: Dict[str, Dict[str, str]], threshold: float
+) -> Dict[str, Any]:
+    """
+    attendance analytics of every course of one semester, computed column wise.
+
+    Args:
+        courses : attendance_scrape output, course_code -> {attended_class, total_class, ...}
+        threshold : required attendance percentage, e.g. 75
+
+    Returns:
+        per course numbers (typed attended/total, percentage, classes needed to reach
+        the threshold, classes that can still be skipped) and a semester summary.
+    """
+    required = Fraction(str(threshold)) / 100
+
+    codes = list(courses)
+    attended = [_to_int(courses[code].get("attended_class")) for code in codes]
+    total = [_to_int(courses[code].get("total_class")) for code in codes]
+
+    percentage = [round(a * 100 / t, 2) if t else 0.0 for a, t in zip(attended, total)]
+    # attend x more in a row : (a + x) / (t + x) >= required
+    needed = [
+        max(0, math.ceil((required * t - a) / (1 - required)))
+        for a, t in zip(attended, total)
+    ]
+    # miss y in a row : a / (t + y) >= required
+    can_skip = [
+        max(0, math.floor(a / required - t)) if t else 0
+        for a, t in zip(attended, total)
+    ]
+    below = [bool(t) and a < required * t for a, t in zip(attended, total)]
+
+    total_attended = sum(attended)
+    total_classes = sum(total)
+
+    return {
+        "threshold": threshold,
+        "courses": {
+            code: {
+                "course_name": courses[code].get("course_name", ""),
+                "attended_class": attended[i],
+                "total_class": total[i],
+                "attendance_percentage": percentage[i],
+                "classes_needed": needed[i],
+                "classes_can_skip": can_skip[i],
+                "below_threshold": below[i],
+            }
+            for i, code in enumerate(codes)
+        },
+        "summary": {
+            "courses": len(codes),
+            "courses_below_threshold": sum(below),
+            "attended_class": total_attended,
+            "total_class": total_classes,
+            "attendance_percentage": (
+                round(total_attended * 100 / total_classes, 2) if total_classes else 0.0
+            ),
+            "classes_needed": sum(needed),
+        },
+    }
+
+
+def analyse_attendance(
+    attendance: Dict[str, Dict[str, Dict[str, str]]],
+    threshold: float = ATTENDANCE_THRESHOLD,
+) -> Dict[str, Dict[str, Any]]:
+    """attendance analytics for every semester, keyed by sem_id like the raw attendance"""
+    if not 0 < threshold < 100:
+        raise ValueError(
+            f"attendance threshold must be between 0 and 100 : {threshold}"
+        )
+    return {
+        sem_id: analyse_semester(courses or {}, threshold)
+        for sem_id, courses in attendance.items()
+    }
+
+
+if __name__ == "__main__":
+    import json
+
+    attendance = {
+        "CH20242505": {
+            "CSE1001": {
+                "course_name": "Problem Solving",
+                "total_class": "40",
+                "attended_class": "28",
+                "attendance_percentage": "70%",
+            },
+            "MAT1001": {
+                "course_name": "Calculus",
+                "total_class": "30",
+                "attended_class": "29",
+                "attendance_percentage": "97%",
+            },
+        }
+    }
+    print(json.dumps(analyse_attendance(attendance, 75), indent=4))
@@ -0,0 +1,276 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# cache key : (reg_no, section, sem_id), sem_id is None for whole-section reads
+CacheKey = tuple[str, str, str | None]
+
+
+class LRUCache:
+    """
+    bounded in-process read-through cache for the /llm endpoints.
+    entries expire after `ttl` seconds and the least recently used entries are
+    evicted once either `max_entries` or `max_bytes` is exceeded.
+    values are the encoded response bodies, so their size is just len(value).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[CacheKey, tuple[bytes, float]] = OrderedDict()
+        self._keys_by_reg_no: dict[str, set[CacheKey]] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0 and self.max_bytes > 0
+
+    async def get(self, key: CacheKey) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def set(self, key: CacheKey, value: bytes) -> None:
+        if not self.enabled or len(value) > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._keys_by_reg_no.setdefault(key[0], set()).add(key)
+        self._bytes += len(value)
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def invalidate(self, reg_no: str) -> None:
+        """drop every cached section of the student"""
+        keys = self._keys_by_reg_no.pop(reg_no, set())
+        for key in keys:
+            value, _ = self._entries.pop(key)
+            self._bytes -= len(value)
+        if keys:
+            self.invalidations += 1
+            logger.info(f"invalidated {len(keys)} cache entries for {reg_no}")
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: CacheKey) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+        keys = self._keys_by_reg_no.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_reg_no[key[0]]
+
+
+class LocalRedis:
+    """
+    embedded stand-in for the subset of the redis.asyncio client used by
+    RedisCache, so the shared cache path can run without a redis server (tests,
+    single host development). data lives in this process only.
+    """
+
+    def __init__(self):
+        self._data: dict[str, tuple[bytes | set[str], float | None]] = {}
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> bytes | None:
+        return self._live(key)
+
+    async def set(self, key: str, value: bytes, ex: int | None = None) -> None:
+        self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    async def sadd(self, key: str, *members: str) -> None:
+        value = self._live(key) or set()
+        value.update(members)
+        _, expires_at = self._data.get(key, (None, None))
+        self._data[key] = (value, expires_at)
+
+    async def smembers(self, key: str) -> "set[str]":
+        return set(self._live(key) or ())
+
+    async def expire(self, key: str, seconds: int) -> None:
+        value = self._live(key)
+        if value is not None:
+            self._data[key] = (value, time.monotonic() + seconds)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def aclose(self) -> None:
+        self._data.clear()
+
+
+class RedisCache:
+    """
+    shared cache backend speaking the redis protocol, so every uvicorn worker
+    and host sees the same entries. uses the same (reg_no, section, sem_id) keys
+    and ttl as LRUCache, memory is bounded by the server's maxmemory policy.
+    every student has a key set used to invalidate all its sections at once.
+    """
+
+    def __init__(self, client, ttl: float, prefix: str = "vtop:llm"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _key(self, key: CacheKey) -> str:
+        reg_no, section, sem_id = key
+        return f"{self.prefix}:{reg_no}:{section}:{sem_id or '*'}"
+
+    def _index_key(self, reg_no: str) -> str:
+        return f"{self.prefix}:{reg_no}:keys"
+
+    async def get(self, key: CacheKey) -> bytes | None:
+        try:
+            value = await self.client.get(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"cache get failed for {key} : {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def set(self, key: CacheKey, value: bytes) -> None:
+        if not self.enabled:
+            return
+        redis_key = self._key(key)
+        index_key = self._index_key(key[0])
+        try:
+            await self.client.set(redis_key, value, ex=self.ttl)
+            await self.client.sadd(index_key, redis_key)
+            await self.client.expire(index_key, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"cache set failed for {key} : {e}")
+
+    async def invalidate(self, reg_no: str) -> None:
+        """drop every cached section of the student"""
+        index_key = self._index_key(reg_no)
+        try:
+            keys = await self.client.smembers(index_key)
+            await self.client.delete(*keys, index_key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"cache invalidation failed for {reg_no} : {e}")
+            return
+        if keys:
+            self.invalidations += 1
+            logger.info(f"invalidated {len(keys)} cache entries for {reg_no}")
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "local" if isinstance(self.client, LocalRedis) else "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+            "invalidations": self.invalidations,
+        }
+
+
+def connect_redis(url: str):
+    """create a redis.asyncio client, redis is only needed for the shared backends"""
+    try:
+        from redis import asyncio as redis
+    except ImportError:
+        raise RuntimeError("the redis package is required for a redis backend")
+    return redis.from_url(url)
+
+
+def make_cache() -> LRUCache | RedisCache:
+    """
+    build the /llm cache from the environment
+    LLM_CACHE_BACKEND : [ "memory", "redis", "local" ]
+    """
+    backend = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("LLM_CACHE_TTL", "600"))
+
+    if backend == "redis":
+        url = os.getenv("LLM_CACHE_REDIS_URL", "redis://localhost:6379/0")
+        logger.info("using redis backend for the llm cache")
+        return RedisCache(connect_redis(url), ttl=ttl)
+
+    if backend == "local":
+        logger.info("using embedded local redis stand-in for the llm cache")
+        return RedisCache(LocalRedis(), ttl=ttl)
+
+    if backend != "memory":
+        raise ValueError(f"unknown LLM_CACHE_BACKEND : {backend}")
+
+    return LRUCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048")),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=ttl,
+    )
+
+
+cache = make_cache()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import httpx
+from dotenv import load_dotenv
+
+from utils.prelogin import fetch_prelogin
+from utils.validator import make_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# ready prelogin sessions kept per worker, 0 disables the pool
+CAPTCHA_POOL_SIZE = int(os.getenv("CAPTCHA_POOL_SIZE", "0"))
+
+# seconds a prelogin session stays in the pool, keep it well under vtop's own timeout
+CAPTCHA_POOL_TTL = float(os.getenv("CAPTCHA_POOL_TTL", "120"))
+
+# seconds to wait after a failed prelogin before trying again
+CAPTCHA_POOL_RETRY = 5.0
+
+
+@dataclass
+class Prelogin:
+    client: httpx.AsyncClient
+    csrf: str
+    image_code: str
+    created_at: float
+
+
+class CaptchaPool:
+    """
+    vtop sessions already walked to the login form (cookie jar, csrf token, captcha),
+    so prepare_login can hand one over instead of doing the round trips while the
+    student waits. a background task refills the pool one prelogin at a time and
+    drops entries older than ttl, their clients are aclose()d.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._ready: deque[Prelogin] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and self.ttl > 0
+
+    async def _drop_expired(self) -> None:
+        now = time.time()
+        while self._ready and now - self._ready[0].created_at >= self.ttl:
+            prelogin = self._ready.popleft()
+            await prelogin.client.aclose()
+            self.expired += 1
+
+    async def take(self) -> Prelogin | None:
+        """the oldest ready prelogin session, None when the pool is empty"""
+        await self._drop_expired()
+        if not self._ready:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return self._ready.popleft()
+
+    async def _fill_one(self) -> None:
+        client = make_client()
+        try:
+            csrf, image_code = await fetch_prelogin(client)
+        except Exception:
+            await client.aclose()
+            raise
+        self._ready.append(Prelogin(client, csrf, image_code, time.time()))
+
+    async def run(self) -> None:
+        """keep the pool full, wake up on take() or when the oldest entry expires"""
+        self._wakeup = asyncio.Event()
+        while True:
+            await self._drop_expired()
+
+            if len(self._ready) < self.size:
+                try:
+                    await self._fill_one()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"error in pre-warming a captcha : {e}")
+                    await asyncio.sleep(CAPTCHA_POOL_RETRY)
+                continue
+
+            self._wakeup.clear()
+            timeout = self._ready[0].created_at + self.ttl - time.time()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        while self._ready:
+            await self._ready.popleft().client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "ready": len(self._ready),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "errors": self.errors,
+        }
+
+
+captcha_pool = CaptchaPool(CAPTCHA_POOL_SIZE, CAPTCHA_POOL_TTL)
@@ -0,0 +1,112 @@
+from typing import Any, Dict, List
+
+# vtop grade letters and their grade points, other letters (P, W, ...) do not count
+GRADE_POINTS = {
+    "S": 10,
+    "A": 9,
+    "B": 8,
+    "C": 7,
+    "D": 6,
+    "E": 5,
+    "F": 0,
+    "N": 0,
+}
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_grade_table(
+    grade_history: Dict[str, Dict[str, str]],
+    current_courses: Dict[str, str],
+    sem_id: str,
+) -> Dict[str, Any]:
+    """
+    precompute the credit weighted grade points of a student for the simulator.
+
+    Args:
+        grade_history : grade_history_scrape output, course_code -> {credit, grade, ...}
+        current_courses : course_code -> credit of the semester being simulated
+        sem_id : the semester being simulated
+
+    Returns:
+        the grade points and credits earned outside the simulated semester, and the
+        parallel code / credit arrays of the simulated semester's courses.
+        courses of the simulated semester are left out of the history, their new
+        grade replaces the old one.
+    """
+    history_points = 0.0
+    history_credits = 0.0
+    for course_code, course in (grade_history or {}).items():
+        if course_code in current_courses:
+            continue
+        grade_point = GRADE_POINTS.get(course.get("grade", "").strip().upper())
+        credit = _to_float(course.get("credit"))
+        if grade_point is None or not credit:
+            continue
+        history_points += credit * grade_point
+        history_credits += credit
+
+    codes = [code for code, credit in current_courses.items() if _to_float(credit)]
+    return {
+        "sem_id": sem_id,
+        "history_points": history_points,
+        "history_credits": history_credits,
+        "codes": codes,
+        "credits": [_to_float(current_courses[code]) for code in codes],
+    }
+
+
+def simulate(
+    table: Dict[str, Any], scenarios: List[Dict[str, str]]
+) -> List[Dict[str, Any]]:
+    """
+    projected semester gpa and cgpa of every scenario, scenario : course_code -> grade.
+    every scenario is one pass over the precomputed credit array, courses without a
+    grade in a scenario are left out of both averages and reported as ungraded.
+    """
+    codes = table["codes"]
+    credits = table["credits"]
+    history_points = table["history_points"]
+    history_credits = table["history_credits"]
+
+    results = []
+    for scenario in scenarios:
+        grades = {
+            code.upper(): grade.strip().upper() for code, grade in scenario.items()
+        }
+        grade_points = [GRADE_POINTS.get(grades.get(code, "")) for code in codes]
+
+        semester_points = sum(
+            credit * point
+            for credit, point in zip(credits, grade_points)
+            if point is not None
+        )
+        semester_credits = sum(
+            credit for credit, point in zip(credits, grade_points) if point is not None
+        )
+        total_credits = history_credits + semester_credits
+
+        results.append(
+            {
+                "gpa": (
+                    round(semester_points / semester_credits, 2)
+                    if semester_credits
+                    else None
+                ),
+                "cgpa": (
+                    round((history_points + semester_points) / total_credits, 2)
+                    if total_credits
+                    else None
+                ),
+                "ungraded": [
+                    code for code, point in zip(codes, grade_points) if point is None
+                ],
+                "unknown_courses": [code for code in grades if code not in codes],
+            }
+        )
+    return results
@@ -0,0 +1,197 @@
+import logging
+import os
+import time
+from collections import deque
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# outcomes of the last requests the failure rate is computed over
+VTOP_BREAKER_WINDOW = int(os.getenv("VTOP_BREAKER_WINDOW", "20"))
+
+# outcomes needed in the window before the breaker may open
+VTOP_BREAKER_MIN_REQUESTS = int(os.getenv("VTOP_BREAKER_MIN_REQUESTS", "10"))
+
+# share of failed or slow requests in the window that opens the breaker, 0 disables it
+VTOP_BREAKER_FAILURE_RATE = float(os.getenv("VTOP_BREAKER_FAILURE_RATE", "0.5"))
+
+# seconds to response headers above which a request counts as failed
+VTOP_BREAKER_SLOW_SECONDS = float(os.getenv("VTOP_BREAKER_SLOW_SECONDS", "10"))
+
+# seconds the breaker stays open before probe requests are let through
+VTOP_BREAKER_OPEN_SECONDS = float(os.getenv("VTOP_BREAKER_OPEN_SECONDS", "30"))
+
+# probe requests in flight at once while half open
+VTOP_BREAKER_PROBES = int(os.getenv("VTOP_BREAKER_PROBES", "1"))
+
+
+class CircuitOpenError(Exception):
+    """vtop is failing, the request was refused without being sent"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("vtop is unavailable, retry later")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    tracks the outcome of the last `window` requests to vtop. a request fails when it
+    raises a transport error (connect / read timeout, refused connection), answers
+    with a 5xx, or takes longer than `slow` seconds to answer.
+    once `failure_rate` of at least `min_requests` outcomes failed the breaker opens :
+    requests are refused with CircuitOpenError for `open_seconds`, then it half opens
+    and lets `probes` requests through at a time. a successful probe closes it, a
+    failed one opens it again.
+    """
+
+    def __init__(
+        self,
+        window: int,
+        min_requests: int,
+        failure_rate: float,
+        slow: float,
+        open_seconds: float,
+        probes: int,
+    ):
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow = slow
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._probing = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_rate > 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def check(self) -> None:
+        """raise CircuitOpenError when a request would be refused now"""
+        if self.state == OPEN and self.retry_after() == 0:
+            self.state = HALF_OPEN
+            self._probing = 0
+            logger.info("vtop circuit breaker half open, probing")
+        if self.state == OPEN or (
+            self.state == HALF_OPEN and self._probing >= self.probes
+        ):
+            self.rejected += 1
+            raise CircuitOpenError(self.retry_after() or self.open_seconds)
+
+    def before_request(self) -> bool:
+        """admit a request, returns whether it is a half open probe"""
+        self.check()
+        if self.state == HALF_OPEN:
+            self._probing += 1
+            return True
+        return False
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.opened += 1
+        self._outcomes.clear()
+
+    def record(self, failed: bool | None, probe: bool = False) -> None:
+        """outcome of an admitted request, None when it ended without one"""
+        if probe:
+            self._probing = max(0, self._probing - 1)
+        if failed is None:
+            return
+        if self.state == HALF_OPEN:
+            if not probe:
+                # answered by a request sent before the breaker opened, not a probe
+                return
+            if failed:
+                self._open()
+                logger.warning("vtop probe failed, circuit breaker open again")
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info("vtop probe succeeded, circuit breaker closed")
+            return
+        if self.state == OPEN:
+            # answers of requests sent before the breaker opened
+            return
+
+        self._outcomes.append(failed)
+        if (
+            len(self._outcomes) >= self.min_requests
+            and self.current_failure_rate() >= self.failure_rate
+        ):
+            self._open()
+            logger.error(
+                f"vtop circuit breaker open for {self.open_seconds}s, "
+                f"{self.failure_rate:.0%} of recent requests failed"
+            )
+
+    def current_failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "failure_rate": round(self.current_failure_rate(), 3),
+            "window": len(self._outcomes),
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """httpx transport sending every request through a circuit breaker"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker):
+        self.transport = transport
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self.breaker.enabled:
+            return await self.transport.handle_async_request(request)
+
+        probe = self.breaker.before_request()
+        started = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            self.breaker.record(True, probe)
+            raise
+        except BaseException:
+            # cancelled or a bug on our side, says nothing about vtop
+            self.breaker.record(None, probe)
+            raise
+        failed = (
+            response.status_code >= 500
+            or time.monotonic() - started > self.breaker.slow
+        )
+        self.breaker.record(failed, probe)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+vtop_breaker = CircuitBreaker(
+    VTOP_BREAKER_WINDOW,
+    VTOP_BREAKER_MIN_REQUESTS,
+    VTOP_BREAKER_FAILURE_RATE,
+    VTOP_BREAKER_SLOW_SECONDS,
+    VTOP_BREAKER_OPEN_SECONDS,
+    VTOP_BREAKER_PROBES,
+)
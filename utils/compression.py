@@ -0,0 +1,152 @@
+import gzip
+import logging
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# supported content codings, in order of preference
+ENCODINGS = ("br", "gzip")
+
+# responses smaller than this are not worth compressing
+MINIMUM_SIZE = 500
+
+# compression levels of responses built per request, on the event loop. the maximum
+# levels are only used by precompress, which runs once per scrape
+ONLINE_BROTLI_QUALITY = 5
+ONLINE_GZIP_LEVEL = 6
+
+
+def envelope(data: str) -> bytes:
+    """wrap an already encoded json value into the {success, data} response envelope"""
+    return b'{"success":true,"data":' + data.encode() + b"}"
+
+
+def compress(body: bytes, encoding: str, online: bool = False) -> bytes:
+    """compress at the maximum level, or at a cheap one for per request responses"""
+    if encoding == "br":
+        quality = ONLINE_BROTLI_QUALITY if online else 11
+        return brotli.compress(body, mode=brotli.MODE_TEXT, quality=quality)
+    if encoding == "gzip":
+        level = ONLINE_GZIP_LEVEL if online else 9
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    raise ValueError(f"unsupported encoding : {encoding}")
+
+
+def precompress(data: str) -> dict[str, bytes]:
+    """
+    compress the response envelope of a stored section once for every encoding,
+    encodings that do not make the body smaller are left out.
+    """
+    body = envelope(data)
+    if len(body) < MINIMUM_SIZE:
+        return {}
+    compressed = {}
+    for encoding in ENCODINGS:
+        value = compress(body, encoding)
+        if len(value) < len(body):
+            compressed[encoding] = value
+    return compressed
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """pick the preferred supported encoding allowed by an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+
+    for encoding in ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """strong etags must differ between the encodings of one representation"""
+    if etag.startswith('"') and etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def strip_encoding(etag: str) -> str:
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[: -len(suffix)] + '"'
+    return etag
+
+
+class CompressionMiddleware:
+    """
+    negotiate br / gzip for complete responses built per request.
+    responses that are already encoded (precompressed sections), streamed
+    responses (/student/ask) and small bodies are passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+
+        async def send_with_compression(message: Message) -> None:
+            nonlocal start
+
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            initial, start = start, None
+            headers = MutableHeaders(raw=initial["headers"])
+            body = message.get("body", b"")
+
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+            ):
+                await send(initial)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding, online=True)
+            headers.add_vary_header("Accept-Encoding")
+            if len(compressed) < len(body):
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                if "etag" in headers:
+                    headers["ETag"] = encoded_etag(headers["etag"], encoding)
+                message["body"] = compressed
+
+            await send(initial)
+            await send(message)
+
+        await self.app(scope, receive, send_with_compression)
@@ -0,0 +1,150 @@
+import json
+import logging
+import zlib
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+from database import sessionLocal
+
+logger = logging.getLogger(__name__)
+
+# rows read per keyset page, each page in its own short read transaction
+BATCH_SIZE = 500
+
+# ndjson lines are flushed to the client in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+def to_utc(value: datetime | None) -> datetime | None:
+    """updated_at is stored as naive utc"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def record_line(row, sections: Sequence[str]) -> str:
+    """one ndjson line of a fetched row, the stored json sections are not decoded"""
+    reg_no, updated_at, *values = row
+    parts = [
+        '"reg_no":' + json.dumps(reg_no),
+        '"updated_at":'
+        + json.dumps(updated_at.isoformat() + "Z" if updated_at else None),
+    ]
+    for section, value in zip(sections, values):
+        parts.append(json.dumps(section) + ":" + (value or "null"))
+    return "{" + ",".join(parts) + "}\n"
+
+
+def fetch_page(
+    db: Session,
+    sections: Sequence[str],
+    updated_since: datetime | None,
+    after: str | None,
+) -> list:
+    """the next BATCH_SIZE student rows ordered by reg_no, after the given reg_no"""
+    columns = [getattr(models.Student, section) for section in sections]
+    stmt = (
+        select(models.Student.reg_no, models.Student.updated_at, *columns)
+        .order_by(models.Student.reg_no)
+        .limit(BATCH_SIZE)
+    )
+    if updated_since is not None:
+        stmt = stmt.where(models.Student.updated_at >= to_utc(updated_since))
+    if after is not None:
+        stmt = stmt.where(models.Student.reg_no > after)
+    return db.execute(stmt).all()
+
+
+def iter_student_records(
+    sections: Sequence[str] = models.STUDENT_SECTIONS,
+    updated_since: datetime | None = None,
+) -> Iterator[str]:
+    """
+    yield every student row as one ndjson line, ordered by reg_no.
+    rows are read in keyset pages of BATCH_SIZE, each with its own session that is
+    closed before the page is yielded : a slow client never holds a read transaction,
+    which would lock out the scrapes writing to sqlite. the stored json sections are
+    spliced into the line without decoding, so memory stays flat.
+    """
+    after = None
+    while True:
+        with sessionLocal() as db:
+            rows = fetch_page(db, sections, updated_since, after)
+        if not rows:
+            return
+        yield from (record_line(row, sections) for row in rows)
+        if len(rows) < BATCH_SIZE:
+            return
+        after = rows[-1][0]
+
+
+def iter_chunks(lines: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """group ndjson lines into CHUNK_SIZE chunks, gzip compressed as a stream if asked"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+
+    def flush() -> bytes:
+        data = "".join(buffer).encode()
+        buffer.clear()
+        return compressor.compress(data) if compressor else data
+
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            size = 0
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_students(
+    sections: Sequence[str] = models.STUDENT_SECTIONS,
+    updated_since: datetime | None = None,
+    compress: bool = False,
+) -> Iterator[bytes]:
+    """stream the export, it reads the database on its own sessions and outlives the request"""
+    yield from iter_chunks(iter_student_records(sections, updated_since), compress)
+    logger.info("student export completed")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="export every student as ndjson")
+    parser.add_argument(
+        "--section",
+        action="append",
+        choices=models.STUDENT_SECTIONS,
+        help="section to export, repeat for several (default: all)",
+    )
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="only rows updated at or after this ISO timestamp (UTC if no offset)",
+    )
+    parser.add_argument("--gzip", action="store_true", help="gzip compress the output")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_students(
+            args.section or models.STUDENT_SECTIONS, args.since, args.gzip
+        ):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
@@ -0,0 +1,81 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from utils.prelogin import BASE_URL
+from utils.scrape import login_scrape as sc
+from utils.session_jobs import PeriodicSessionJob
+from utils.validator import (
+    ACTIVE,
+    EXPIRED,
+    get_client,
+    session_store,
+    set_session_status,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# seconds between two pings of a logged in session, 0 disables the keepalive
+SESSION_KEEPALIVE_INTERVAL = float(os.getenv("SESSION_KEEPALIVE_INTERVAL", "0"))
+
+# pings in flight at once
+SESSION_KEEPALIVE_CONCURRENCY = int(os.getenv("SESSION_KEEPALIVE_CONCURRENCY", "4"))
+
+# cheap authenticated page, vtop answers it with the login page once the session is gone
+KEEPALIVE_URL = f"{BASE_URL}/vtop/content"
+
+
+def track_active(job: PeriodicSessionJob) -> None:
+    """track the logged in sessions this worker already holds (restored at startup)"""
+    for reg_no, status in list(session_store.status.items()):
+        if status == ACTIVE:
+            job.track(reg_no)
+
+
+class KeepaliveScheduler(PeriodicSessionJob):
+    """
+    pings vtop for every logged in session, so vtop does not drop it while the student
+    is idle and a dropped session is found before a scrape is started on it.
+    a session vtop no longer knows is marked expired, validate_session then answers
+    401 until the student logs in again. network errors are retried at the next ping.
+    """
+
+    name = "keepalive ping"
+
+    def __init__(self, interval: float, concurrency: int):
+        super().__init__(interval, concurrency)
+        self.expired = 0
+
+    async def job(self, reg_no: str) -> bool:
+        client = await get_client(reg_no)
+        if client is None or session_store.status.get(reg_no) != ACTIVE:
+            return False
+
+        try:
+            response = await client.get(KEEPALIVE_URL)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"keepalive ping failed for {reg_no} : {e}")
+            return True
+
+        if (
+            response.status_code == 200
+            and sc.extract_csrf_from_content_page(response.text) is not None
+        ):
+            return True
+
+        self.expired += 1
+        await set_session_status(reg_no, EXPIRED)
+        logger.warning(f"vtop session of {reg_no} expired, marked invalid")
+        return False
+
+    def stats(self) -> dict:
+        return {**super().stats(), "expired": self.expired}
+
+
+keepalive = KeepaliveScheduler(
+    SESSION_KEEPALIVE_INTERVAL, SESSION_KEEPALIVE_CONCURRENCY
+)
@@ -1,9 +1,13 @@
+import asyncio
+import hashlib
 import json
+import os
 from email.utils import formatdate
 from fastapi import HTTPException
 import time
-from httpx import AsyncClient
-from sqlalchemy import Column
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from httpx import AsyncClient, Response
 from utils.scrape import (
     profile_scrape,
     semester_scrape,
@@ -13,15 +17,98 @@ from utils.scrape import (
     attendance_scrape,
     gpa_per_semester,
 )
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
 import models
+from database import sessionLocal
 import logging
 from .validator import delete_session, delete_csrf_token
+from .cache import cache
+from .circuit_breaker import CircuitOpenError, vtop_breaker
+from .timeouts import ScrapeDeadlineExceeded, scrape_deadline
+from .compression import precompress
 from utils.semester_pre_process import semester_pre_process
+from utils.attendance_analytics import analyse_attendance
+
+load_dotenv()
+
+# seconds a semester page found empty is skipped by later scrapes, 0 disables it.
+# the latest semester is always scraped, it is the one still filling in
+EMPTY_PAGE_TTL = float(os.getenv("EMPTY_PAGE_TTL", "604800"))
+
+# errors that stop a scrape before vtop answered, not a sign the data is missing
+INTERRUPTIONS = (ScrapeDeadlineExceeded, CircuitOpenError)
+
+
+def compute_etag(data: str) -> str:
+    """strong etag of a stored json section"""
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+def course_index_rows(reg_no: str, timetable: dict | None) -> list[dict]:
+    """one row per (semester, course) registered in a scraped timetable"""
+    courses = {}
+    for sem_id, semester_timetable in (timetable or {}).items():
+        for periods in semester_timetable.values():
+            for period in periods:
+                course_code = period.get("course_code", "")
+                course_name = period.get("course_name", "")
+                if not course_code or not course_name:
+                    continue
+                if (sem_id, course_code) in courses:
+                    continue
+                details = period.get("details", {})
+                courses[(sem_id, course_code)] = {
+                    "reg_no": reg_no,
+                    "sem_id": sem_id,
+                    "course_code": course_code,
+                    "course_name": course_name,
+                    "credit": details.get("credit", ""),
+                    "faculty": details.get("faculty-name", ""),
+                    "slot": details.get("slot", ""),
+                    "venue": details.get("venue", ""),
+                }
+    return list(courses.values())
+
+
+def backfill_course_index() -> int:
+    """
+    index the stored timetables of students scraped before the course index existed,
+    returns the number of students indexed
+    """
+    with sessionLocal() as db:
+        indexed = select(models.StudentCourse.reg_no).distinct()
+        reg_nos = list(
+            db.scalars(
+                select(models.Student.reg_no).where(
+                    models.Student.timetable.is_not(None),
+                    models.Student.reg_no.not_in(indexed),
+                )
+            )
+        )
+        count = 0
+        for reg_no in reg_nos:
+            timetable = db.scalar(
+                select(models.Student.timetable).where(models.Student.reg_no == reg_no)
+            )
+            rows = course_index_rows(reg_no, json.loads(timetable or "null"))
+            if rows:
+                db.execute(insert(models.StudentCourse).values(rows))
+                count += 1
+        db.commit()
+        return count
 
 
 class VtopScraper:
-    def __init__(self, client: AsyncClient, reg_no: str, csrf_token, db: Session):
+    def __init__(
+        self,
+        client: AsyncClient,
+        reg_no: str,
+        csrf_token,
+        db: Session,
+        recheck_empty: bool = False,
+    ):
         self.client = client
         self.csrf_token = csrf_token
         self.reg_no = reg_no
@@ -34,98 +121,291 @@ class VtopScraper:
         self.cgpa_details = None
         self.grades_count = None
         self.attendance = None
+        self.attendance_analytics = None
         self.db = db
         self.name = None
+        # request semester pages last found empty anyway
+        self.recheck_empty = recheck_empty
+        self._empty_pages = None
+        self._checked_pages = {}
+        # set once the deadline or the circuit breaker cut a section short
+        self.interrupted = False
 
         self.logger = logging.getLogger(__name__)
 
     async def save_to_database(self):
+        """
+        upsert the scraped sections in a single INSERT ... ON CONFLICT DO UPDATE,
+        sections that failed to scrape (None) are left untouched in the existing row.
+        the etag and the precompressed response body of every written section,
+        and the course index, are replaced in the same transaction.
+        """
         try:
-            self.logger.info("checking if the user exist in the database")
+            values = {
+                section: json.dumps(getattr(self, section))
+                for section in models.STUDENT_SECTIONS
+                if getattr(self, section) is not None
+            }
+
+            self.logger.info(f"upserting sections {list(values)} for the student")
 
-            # Check if student with reg_no exists
-            existing_student = (
-                self.db.query(models.Student)
-                .filter(models.Student.reg_no == self.reg_no)
-                .first()
+            # brotli / gzip at the maximum levels take a while, off the event loop
+            compressed = await asyncio.to_thread(
+                lambda: {section: precompress(data) for section, data in values.items()}
             )
 
-            if existing_student:
-                self.logger.info("student exists, updating the record")
-                existing_student.profile = Column(json.dumps(self.profile))
-                existing_student.semester = Column(json.dumps(self.semester))
-                existing_student.timetable = Column(json.dumps(self.timetable))
-                existing_student.marks = Column(json.dumps(self.marks))
-                existing_student.grade_history = Column(json.dumps(self.grade_history))
-                existing_student.attendance = Column(json.dumps(self.attendance))
-                existing_student.credits_info = Column(json.dumps(self.credits_info))
-                existing_student.grades_count = Column(json.dumps(self.grades_count))
-                existing_student.cgpa_details = Column(json.dumps(self.cgpa_details))
-
-                self.db.commit()
-                self.db.refresh(existing_student)
-                self.logger.info("student record updated successfully")
+            updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            stmt = insert(models.Student).values(
+                reg_no=self.reg_no, updated_at=updated_at, **values
+            )
+            if values:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[models.Student.reg_no],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in (*values, "updated_at")
+                    },
+                )
             else:
-                self.logger.info("student does not exist, creating new record")
-                student_model = models.Student(
-                    reg_no=self.reg_no,
-                    profile=json.dumps(self.profile),
-                    semester=json.dumps(self.semester),
-                    timetable=json.dumps(self.timetable),
-                    marks=json.dumps(self.marks),
-                    grade_history=json.dumps(self.grade_history),
-                    attendance=json.dumps(self.attendance),
-                    credits_info=json.dumps(self.credits_info),
-                    grades_count=json.dumps(self.grades_count),
-                    cgpa_details=json.dumps(self.cgpa_details),
+                stmt = stmt.on_conflict_do_nothing(
+                    index_elements=[models.Student.reg_no]
                 )
 
-                self.db.add(student_model)
-                self.db.commit()
-                self.db.refresh(student_model)
+            self.db.execute(stmt)
+
+            if values:
+                self.save_etags(values)
+                self.save_compressed(compressed)
+
+            if self.timetable is not None:
+                self.save_course_index()
+
+            if self._checked_pages:
+                self.save_empty_pages()
+
+            self.db.commit()
+            await cache.invalidate(self.reg_no)
 
-                self.logger.info("student model is created successfully")
+            self.logger.info("student record saved successfully")
 
         except Exception as e:
             self.logger.error(f"Error occurred: {e}")
             self.db.rollback()
             raise
 
-    async def scrape_all(self):
-        self.profile = await self.scrape_profile()
+    def save_etags(self, values: dict[str, str]):
+        stmt = insert(models.SectionETag).values(
+            [
+                {"reg_no": self.reg_no, "section": section, "etag": compute_etag(data)}
+                for section, data in values.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.SectionETag.reg_no, models.SectionETag.section],
+            set_={"etag": stmt.excluded.etag},
+        )
+        self.db.execute(stmt)
+
+    def save_compressed(self, compressed: dict[str, dict[str, bytes]]):
+        """replace the precompressed bodies, section -> encoding -> body"""
+        self.db.execute(
+            delete(models.CompressedSection).where(
+                models.CompressedSection.reg_no == self.reg_no,
+                models.CompressedSection.section.in_(compressed),
+            )
+        )
+        rows = [
+            {
+                "reg_no": self.reg_no,
+                "section": section,
+                "encoding": encoding,
+                "body": body,
+            }
+            for section, bodies in compressed.items()
+            for encoding, body in bodies.items()
+        ]
+        if rows:
+            self.db.execute(insert(models.CompressedSection).values(rows))
+
+    def build_course_index(self) -> list[dict]:
+        return course_index_rows(self.reg_no, self.timetable)
+
+    def save_course_index(self):
+        self.db.execute(
+            delete(models.StudentCourse).where(
+                models.StudentCourse.reg_no == self.reg_no
+            )
+        )
+        rows = self.build_course_index()
+        if rows:
+            self.db.execute(insert(models.StudentCourse).values(rows))
+        self.logger.info(f"indexed {len(rows)} courses for the student")
+
+    def still_filling(self, page: str, sem_id: str) -> bool:
+        """
+        the latest semester is still filling in, and the gpa of the one before is
+        usually published after the next semester is listed : their pages are always
+        requested and never recorded as empty
+        """
+        recent = sorted(self.semester, reverse=True)[: 2 if page == "gpa" else 1]
+        return sem_id in recent
+
+    def skip_empty(self, page: str, sem_id: str) -> bool:
+        """whether the semester page was found empty within EMPTY_PAGE_TTL"""
+        if (
+            self.recheck_empty
+            or EMPTY_PAGE_TTL <= 0
+            or self.still_filling(page, sem_id)
+        ):
+            return False
+        if self._empty_pages is None:
+            cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+                seconds=EMPTY_PAGE_TTL
+            )
+            rows = self.db.query(models.EmptyPage.page, models.EmptyPage.sem_id).filter(
+                models.EmptyPage.reg_no == self.reg_no,
+                models.EmptyPage.checked_at >= cutoff,
+            )
+            self._empty_pages = {(page, sem) for page, sem in rows}
+        if (page, sem_id) not in self._empty_pages:
+            return False
+        self.logger.info(f"skipping {page} of {sem_id}, it was empty when last checked")
+        return True
+
+    def check_page(self, page: str, sem_id: str, response: Response, empty: bool):
+        """remember whether a semester page vtop answered successfully was empty"""
+        if response.is_success:
+            # an empty page still filling in clears its entry instead of being recorded
+            self._checked_pages[(page, sem_id)] = empty and not self.still_filling(
+                page, sem_id
+            )
+
+    def save_empty_pages(self):
+        checked_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        empty = [key for key, is_empty in self._checked_pages.items() if is_empty]
+        filled = [key for key, is_empty in self._checked_pages.items() if not is_empty]
+        if empty:
+            stmt = insert(models.EmptyPage).values(
+                [
+                    {
+                        "reg_no": self.reg_no,
+                        "page": page,
+                        "sem_id": sem_id,
+                        "checked_at": checked_at,
+                    }
+                    for page, sem_id in empty
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[
+                    models.EmptyPage.reg_no,
+                    models.EmptyPage.page,
+                    models.EmptyPage.sem_id,
+                ],
+                set_={"checked_at": stmt.excluded.checked_at},
+            )
+            self.db.execute(stmt)
+        if filled:
+            self.db.execute(
+                delete(models.EmptyPage).where(
+                    models.EmptyPage.reg_no == self.reg_no,
+                    tuple_(models.EmptyPage.page, models.EmptyPage.sem_id).in_(filled),
+                )
+            )
+
+    async def scrape_all(self, keep_session: bool = False):
+        """
+        scrape every section and save it, the vtop session is closed afterwards unless
+        keep_session is set (the background refresher keeps using it).
+        fails fast with CircuitOpenError while vtop is down, before the session is used.
+        the vtop requests share the SCRAPE_DEADLINE. a section the deadline or the
+        circuit breaker cuts short is left as None, so its stored value is kept.
+        """
+        vtop_breaker.check()
+        with scrape_deadline():
+            self.profile = await self.scrape_profile()
 
-        if self.profile:
-            self.name = self.profile.get("name")
+            if self.profile:
+                self.name = self.profile.get("name")
 
-        self.semester = await self.scrape_semester()
+            self.semester = await self.scrape_semester()
 
-        self.timetable = await self.scrape_timetable()
+            self.timetable = await self.scrape_timetable()
 
-        self.cgpa_details = await self.scrape_gpa_per_semester()
+            self.cgpa_details = await self.scrape_gpa_per_semester()
 
-        self.marks = await self.scrape_marks()
+            self.marks = await self.scrape_marks()
 
-        (
-            self.grade_history,
-            self.credits_info,
-            cgpa,
-            self.grades_count,
-        ) = await self.scrape_grader_history_and_cgpa_and_grade_count()
+            (
+                self.grade_history,
+                self.credits_info,
+                cgpa,
+                self.grades_count,
+            ) = await self.scrape_grader_history_and_cgpa_and_grade_count()
 
-        if self.cgpa_details:
-            if cgpa:
-                self.cgpa_details["cgpa"] = cgpa
-            else:
-                self.cgpa_details["cpga"] = 0
+            if self.cgpa_details:
+                if cgpa:
+                    self.cgpa_details["cgpa"] = cgpa
+                elif self.interrupted:
+                    # the cgpa was never asked for, keep the stored cgpa details whole
+                    self.cgpa_details = None
+                else:
+                    self.cgpa_details["cgpa"] = 0
+
+            self.attendance = await self.scrape_attendance()
 
-        self.attendance = await self.scrape_attendance()
+            if self.attendance:
+                self.attendance_analytics = analyse_attendance(self.attendance)
 
         await self.save_to_database()
 
-        await self.clean_up()
+        if not keep_session:
+            await self.clean_up()
 
         return self.name
 
+    async def refresh_volatile(self) -> bool:
+        """
+        re-scrape attendance and marks of the latest semester, the only ones still
+        changing, and merge them into the stored sections. other sections and older
+        semesters are left as stored. returns False when nothing could be refreshed.
+        """
+        vtop_breaker.check()
+        student = self.db.get(models.Student, self.reg_no)
+        semesters = json.loads(student.semester or "null") if student else None
+        if not semesters:
+            self.logger.warning("no stored semesters to refresh")
+            return False
+
+        latest = max(semesters)
+        self.semester = {latest: semesters[latest]}
+        with scrape_deadline():
+            attendance = await self.scrape_attendance()
+            marks = await self.scrape_marks()
+        # only the merged sections are written, the semester list stays as stored
+        self.semester = None
+
+        # an empty page does not replace what is stored
+        attendance = {
+            sem_id: data for sem_id, data in (attendance or {}).items() if data
+        }
+        marks = {sem_id: data for sem_id, data in (marks or {}).items() if data}
+
+        if attendance:
+            self.attendance = {
+                **(json.loads(student.attendance or "null") or {}),
+                **attendance,
+            }
+            self.attendance_analytics = analyse_attendance(self.attendance)
+        if marks:
+            self.marks = {**(json.loads(student.marks or "null") or {}), **marks}
+        if not attendance and not marks:
+            return False
+
+        await self.save_to_database()
+        self.logger.info(f"refreshed attendance and marks of {latest}")
+        return True
+
     async def scrape_profile(self):
         try:
             self.logger.info("started scraping profile")
@@ -183,6 +463,10 @@ class VtopScraper:
 
             if self.semester:
                 for sem_id in self.semester.keys():
+                    if self.skip_empty("attendance", sem_id):
+                        attendance_dict[sem_id] = {}
+                        continue
+
                     x_value = formatdate(timeval=None, localtime=False, usegmt=True)
                     attendance_payload = {
                         "authorizedID": self.reg_no,
@@ -210,10 +494,12 @@ class VtopScraper:
                     )
 
                     if not attendance_data:
-                        self.logger.error("error in parsing attendance", exc_info=True)
-                        raise HTTPException(
-                            500, detail="error in parsing attendance data"
+                        self.logger.warning(
+                            f"no attendance for semester : {self.semester[sem_id]}"
                         )
+                    self.check_page(
+                        "attendance", sem_id, attendance_response, not attendance_data
+                    )
                     attendance_dict[sem_id] = attendance_data
 
                     self.logger.info(
@@ -338,6 +624,10 @@ class VtopScraper:
 
             if self.semester:
                 for sem_id in self.semester.keys():
+                    if self.skip_empty("marks", sem_id):
+                        marks_dict[sem_id] = {}
+                        continue
+
                     marks_payload = {
                         "authorizedID": self.reg_no,
                         "_csrf": self.csrf_token,
@@ -361,6 +651,7 @@ class VtopScraper:
                         )
 
                     marks_data = marks_scrape.extract_marks(marks_response.text)
+                    self.check_page("marks", sem_id, marks_response, not marks_data)
 
                     # if not marks_data:
                     #     self.logger.error("error in scraping marks", exc_info=True)
@@ -390,6 +681,10 @@ class VtopScraper:
 
             if self.semester:
                 for sem_id in self.semester.keys():
+                    if self.skip_empty("gpa", sem_id):
+                        gpa_dict[sem_id] = 0
+                        continue
+
                     gpa_payload = {
                         "authorizedID": self.reg_no,
                         "semesterSubId": sem_id,
@@ -411,6 +706,7 @@ class VtopScraper:
                         self.logger.error(f"error in response {e}", exc_info=True)
 
                     gpa = gpa_per_semester.extract_gpa(gpa_response.text)
+                    self.check_page("gpa", sem_id, gpa_response, not gpa)
 
                     if not gpa:
                         self.logger.error(
@@ -430,6 +726,10 @@ class VtopScraper:
             self.logger.error(
                 f"error in scraping grades per semester {str(e)}", exc_info=True
             )
+            if isinstance(e, INTERRUPTIONS):
+                # the remaining semesters were never asked for, keep the stored gpas
+                self.interrupted = True
+                return None
             if self.semester:
                 for sem_id in self.semester.keys():
                     if sem_id in gpa_dict:
@@ -486,6 +786,8 @@ class VtopScraper:
             self.logger.error(
                 f"error in scraping grade history {str(e)}", exc_info=True
             )
+            if isinstance(e, INTERRUPTIONS):
+                self.interrupted = True
             return (None, None, None, None)
 
     async def clean_up(self):
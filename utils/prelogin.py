@@ -0,0 +1,64 @@
+import base64
+import logging
+
+import httpx
+
+from utils.scrape import login_scrape as sc
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://vtopcc.vit.ac.in"
+
+# open page + prelogin setup round trips tried before giving up on a captcha
+PRELOGIN_ATTEMPTS = 3
+
+
+class PreloginError(Exception):
+    pass
+
+
+def captcha_jpeg(image_code: str) -> bytes:
+    """raw jpeg bytes of a data:image/jpeg;base64,... captcha"""
+    return base64.b64decode(image_code.partition(",")[2])
+
+
+async def fetch_prelogin(client: httpx.AsyncClient) -> tuple[str, str]:
+    """
+    walk a fresh vtop client to the login form : GET /vtop/open/page for the csrf
+    token, then POST /vtop/prelogin/setup until vtop answers with an image captcha.
+
+    Returns:
+        (csrf_token, image_code), the client's cookie jar holds the prelogin session
+    """
+    open_page_url = f"{BASE_URL}/vtop/open/page"
+    prelogin_url = f"{BASE_URL}/vtop/prelogin/setup"
+
+    for attempt in range(PRELOGIN_ATTEMPTS, 0, -1):
+        logger.info("Attempting to get image captcha, attempts left: %d", attempt)
+        response = await client.get(url=open_page_url)
+        response.raise_for_status()
+
+        csrf_token = sc.extract_csrf_from_open_page(response.text)
+
+        if csrf_token is None:
+            logger.error("Failed to get CSRF token")
+            raise ValueError("error in getting the csrf token")
+
+        prelogin_payload = {"_csrf": csrf_token, "flag": "VTOP"}
+        response = await client.post(
+            url=prelogin_url,
+            data=prelogin_payload,
+            follow_redirects=True,
+        )
+        response.raise_for_status()
+
+        is_image, image_code = sc.find_image_recaptcha(response.text)
+
+        if is_image:
+            logger.info("Image captcha retrieved successfully")
+            return csrf_token, image_code
+
+    logger.error(
+        f"Failed to retrieve image recaptcha after {PRELOGIN_ATTEMPTS} attempts"
+    )
+    raise PreloginError("failed to retrive image recaptcha")
@@ -0,0 +1,54 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from database import sessionLocal
+from utils.main import VtopScraper
+from utils.scheduler import BACKGROUND, scrape_scheduler
+from utils.session_jobs import PeriodicSessionJob
+from utils.validator import ACTIVE, get_client, get_csrf, session_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# seconds between two refreshes of a student with a live session, 0 disables it
+STUDENT_REFRESH_INTERVAL = float(os.getenv("STUDENT_REFRESH_INTERVAL", "0"))
+
+# refresh scrapes in flight at once
+STUDENT_REFRESH_CONCURRENCY = int(os.getenv("STUDENT_REFRESH_CONCURRENCY", "2"))
+
+
+class StudentRefresher(PeriodicSessionJob):
+    """
+    re-scrapes the volatile sections (attendance, marks) of students whose vtop
+    session is still logged in, so /llm/attendance and /llm/marks stay fresh without
+    the student waiting on a scrape. scrape_all keeps the session open while this is
+    enabled, tracking stops once the session times out or vtop drops it.
+    """
+
+    name = "student refresh"
+
+    def __init__(self, interval: float, concurrency: int):
+        super().__init__(interval, concurrency)
+        self.refreshed = 0
+
+    async def job(self, reg_no: str) -> bool:
+        client = await get_client(reg_no)
+        if client is None or session_store.status.get(reg_no) != ACTIVE:
+            return False
+
+        csrf_token = await get_csrf(reg_no)
+        with sessionLocal() as db:
+            scraper = VtopScraper(client, reg_no, csrf_token, db)
+            async with session_store.hold(client):
+                if await scrape_scheduler.run(BACKGROUND, scraper.refresh_volatile):
+                    self.refreshed += 1
+        return True
+
+    def stats(self) -> dict:
+        return {**super().stats(), "refreshed": self.refreshed}
+
+
+refresher = StudentRefresher(STUDENT_REFRESH_INTERVAL, STUDENT_REFRESH_CONCURRENCY)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select, update
+
+import models
+from database import engine, sessionLocal
+from utils.cache import cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# students not scraped for this many days are deleted, 0 keeps them forever
+STUDENT_RETENTION_DAYS = float(os.getenv("STUDENT_RETENTION_DAYS", "30"))
+
+# students deleted per transaction, keeps every write lock short
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+
+# free pages returned to the filesystem per cleanup run
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2048"))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def stamp_unversioned_students() -> int:
+    """rows written before updated_at existed get a full retention period from now"""
+    with sessionLocal() as db:
+        result = db.execute(
+            update(models.Student)
+            .where(models.Student.updated_at.is_(None))
+            .values(updated_at=_utcnow())
+        )
+        db.commit()
+        return result.rowcount
+
+
+def delete_stale_batch(cutoff: datetime, batch_size: int) -> list[str]:
+    """delete the oldest batch of students not updated since cutoff from every table"""
+    with sessionLocal() as db:
+        reg_nos = list(
+            db.scalars(
+                select(models.Student.reg_no)
+                .where(models.Student.updated_at < cutoff)
+                .order_by(models.Student.updated_at)
+                .limit(batch_size)
+            )
+        )
+        if not reg_nos:
+            return []
+        for table in models.STUDENT_TABLES:
+            db.execute(delete(table).where(table.reg_no.in_(reg_nos)))
+        db.commit()
+        return reg_nos
+
+
+def incremental_vacuum(pages: int) -> None:
+    connection = engine.raw_connection()
+    try:
+        # sqlite3's execute only steps the pragma once (one page), a script runs it to the end
+        connection.driver_connection.executescript(
+            f"PRAGMA incremental_vacuum({int(pages)});"
+        )
+    finally:
+        connection.close()
+
+
+async def evict_stale_students(
+    retention_days: float = STUDENT_RETENTION_DAYS,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    vacuum_pages: int = RETENTION_VACUUM_PAGES,
+) -> int:
+    """
+    delete students not refreshed in retention_days, batch by batch, then return up to
+    vacuum_pages free pages to the filesystem. the database work runs in a thread so
+    the event loop keeps serving requests between batches.
+    """
+    if retention_days <= 0:
+        return 0
+
+    stamped = await asyncio.to_thread(stamp_unversioned_students)
+    if stamped:
+        logger.info(f"stamped updated_at on {stamped} existing students")
+
+    cutoff = _utcnow() - timedelta(days=retention_days)
+    evicted = 0
+    while True:
+        reg_nos = await asyncio.to_thread(delete_stale_batch, cutoff, batch_size)
+        for reg_no in reg_nos:
+            await cache.invalidate(reg_no)
+        evicted += len(reg_nos)
+        if len(reg_nos) < batch_size:
+            break
+
+    if evicted:
+        logger.info(f"evicted {evicted} students not updated since {cutoff}")
+    if vacuum_pages > 0:
+        await asyncio.to_thread(incremental_vacuum, vacuum_pages)
+    return evicted
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# scrape classes, in priority order
+INTERACTIVE, BACKGROUND = "interactive", "background"
+PRIORITY = (INTERACTIVE, BACKGROUND)
+
+# scrapes running at once, over every class
+SCRAPE_MAX_CONCURRENCY = int(os.getenv("SCRAPE_MAX_CONCURRENCY", "8"))
+
+# scrapes of each class running at once, background is kept under the total so
+# interactive scrapes always find a free slot quickly
+SCRAPE_BUDGETS = {
+    INTERACTIVE: int(
+        os.getenv("SCRAPE_INTERACTIVE_SLOTS", str(SCRAPE_MAX_CONCURRENCY))
+    ),
+    BACKGROUND: int(os.getenv("SCRAPE_BACKGROUND_SLOTS", "2")),
+}
+
+# seconds after which a queued scrape is served before higher priority ones
+SCRAPE_AGING_SECONDS = float(os.getenv("SCRAPE_AGING_SECONDS", "60"))
+
+
+class ScrapeScheduler:
+    """
+    admits scrapes into a bounded number of slots, one queue per class.
+    a free slot goes to the highest priority class that is under its budget, unless a
+    lower priority scrape has waited longer than `aging` seconds : aged scrapes are
+    served oldest first, so background work is delayed by interactive bursts but
+    never starved.
+    """
+
+    def __init__(self, max_concurrency: int, budgets: dict[str, int], aging: float):
+        self.max_concurrency = max_concurrency
+        self.budgets = budgets
+        self.aging = aging
+        self.running = {cls: 0 for cls in PRIORITY}
+        self._queues: dict[str, deque[tuple[float, asyncio.Future]]] = {
+            cls: deque() for cls in PRIORITY
+        }
+        self.admitted = {cls: 0 for cls in PRIORITY}
+        self.aged = 0
+        self.max_wait = {cls: 0.0 for cls in PRIORITY}
+
+    def _can_start(self, cls: str) -> bool:
+        return (
+            sum(self.running.values()) < self.max_concurrency
+            and self.running[cls] < self.budgets[cls]
+        )
+
+    def _pick(self) -> str | None:
+        candidates = [
+            cls for cls in PRIORITY if self._queues[cls] and self._can_start(cls)
+        ]
+        if not candidates:
+            return None
+
+        now = time.monotonic()
+        aged = [
+            cls for cls in candidates if now - self._queues[cls][0][0] >= self.aging
+        ]
+        if aged:
+            cls = min(aged, key=lambda cls: self._queues[cls][0][0])
+            if cls != candidates[0]:
+                self.aged += 1
+            return cls
+        return candidates[0]
+
+    def _dispatch(self) -> None:
+        while (cls := self._pick()) is not None:
+            enqueued_at, waiter = self._queues[cls].popleft()
+            if waiter.done():
+                continue
+            self.running[cls] += 1
+            self.admitted[cls] += 1
+            self.max_wait[cls] = max(self.max_wait[cls], time.monotonic() - enqueued_at)
+            waiter.set_result(None)
+
+    def _release(self, cls: str) -> None:
+        self.running[cls] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, cls: str):
+        """wait for a slot of the class, held until the block exits"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[cls].append((time.monotonic(), waiter))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # cancelled after the slot was granted, hand it to the next scrape
+            if waiter.done() and not waiter.cancelled():
+                self._release(cls)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(cls)
+
+    async def run(self, cls: str, func, *args, **kwargs):
+        """run func(*args, **kwargs) in a slot of the class"""
+        async with self.slot(cls):
+            return await func(*args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "aged": self.aged,
+            **{
+                cls: {
+                    "budget": self.budgets[cls],
+                    "running": self.running[cls],
+                    "queued": len(self._queues[cls]),
+                    "admitted": self.admitted[cls],
+                    "max_wait": round(self.max_wait[cls], 3),
+                }
+                for cls in PRIORITY
+            },
+        }
+
+
+scrape_scheduler = ScrapeScheduler(
+    SCRAPE_MAX_CONCURRENCY, SCRAPE_BUDGETS, SCRAPE_AGING_SECONDS
+)
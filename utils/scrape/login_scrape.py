@@ -42,6 +42,21 @@ def extract_image_recaptcha(html_content: str):
         return False, None
 
 
+# the captcha data uri inside the captcha block, matched without parsing the page
+CAPTCHA_IMAGE_PATTERN = re.compile(
+    r'id=["\']captchaBlock["\'].*?src=["\'](data:image/jpeg;base64,[^"\']+)["\']',
+    re.DOTALL,
+)
+
+
+def find_image_recaptcha(html_content: str):
+    """regex lookup of the captcha, falls back to the soup when the markup differs"""
+    match = CAPTCHA_IMAGE_PATTERN.search(html_content)
+    if match:
+        return True, match.group(1)
+    return extract_image_recaptcha(html_content)
+
+
 def extract_error_message(html_content: str):
     try:
         soup = BeautifulSoup(html_content, "html.parser")
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import time
+from http.cookiejar import Cookie
+from typing import Any
+
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+from database import sessionLocal
+from utils.cache import LocalRedis, connect_redis
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# session state : {"cookies": [...], "csrf": str | None, "captcha": base64 | None,
+#                  "status": str, "deadline": unix time}
+SessionState = dict[str, Any]
+
+COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "expires")
+
+
+def dump_cookies(cookies: httpx.Cookies) -> list[dict]:
+    return [
+        {field: getattr(cookie, field) for field in COOKIE_FIELDS}
+        for cookie in cookies.jar
+    ]
+
+
+def load_cookies(cookies: httpx.Cookies, dumped: list[dict]) -> None:
+    """replace the content of a cookie jar with dumped cookies"""
+    cookies.jar.clear()
+    for item in dumped:
+        domain = item["domain"] or ""
+        cookies.jar.set_cookie(
+            Cookie(
+                version=0,
+                name=item["name"],
+                value=item["value"],
+                port=None,
+                port_specified=False,
+                domain=domain,
+                domain_specified=bool(domain),
+                domain_initial_dot=domain.startswith("."),
+                path=item["path"] or "/",
+                path_specified=True,
+                secure=item["secure"],
+                expires=item["expires"],
+                discard=item["expires"] is None,
+                comment=None,
+                comment_url=None,
+                rest={},
+            )
+        )
+
+
+class SqliteSessionBackend:
+    """session states in the vtop_sessions table of the application database"""
+
+    async def load(self, reg_no: str) -> SessionState | None:
+        with sessionLocal() as db:
+            row = db.get(models.VtopSession, reg_no)
+            if row is None or row.deadline <= time.time():
+                return None
+            return {
+                "cookies": json.loads(row.cookies),
+                "csrf": row.csrf,
+                "captcha": row.captcha,
+                "status": row.status,
+                "deadline": row.deadline,
+            }
+
+    async def save(self, reg_no: str, state: SessionState) -> None:
+        values = {
+            "cookies": json.dumps(state["cookies"]),
+            "csrf": state["csrf"],
+            "captcha": state.get("captcha"),
+            "status": state.get("status"),
+            "deadline": state["deadline"],
+        }
+        stmt = insert(models.VtopSession).values(reg_no=reg_no, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.VtopSession.reg_no], set_=values
+        )
+        with sessionLocal() as db:
+            db.execute(stmt)
+            db.commit()
+
+    async def delete(self, reg_no: str) -> None:
+        with sessionLocal() as db:
+            db.execute(
+                delete(models.VtopSession).where(models.VtopSession.reg_no == reg_no)
+            )
+            db.commit()
+
+    async def purge_expired(self) -> int:
+        with sessionLocal() as db:
+            result = db.execute(
+                delete(models.VtopSession).where(
+                    models.VtopSession.deadline <= time.time()
+                )
+            )
+            db.commit()
+            return result.rowcount
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisSessionBackend:
+    """
+    session states as json values on a redis protocol server, expired by the server
+    at the session deadline.
+    """
+
+    def __init__(self, client, prefix: str = "vtop:session"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, reg_no: str) -> str:
+        return f"{self.prefix}:{reg_no}"
+
+    async def load(self, reg_no: str) -> SessionState | None:
+        value = await self.client.get(self._key(reg_no))
+        if value is None:
+            return None
+        state = json.loads(value)
+        if state["deadline"] <= time.time():
+            return None
+        return state
+
+    async def save(self, reg_no: str, state: SessionState) -> None:
+        ttl = int(state["deadline"] - time.time()) + 1
+        if ttl <= 0:
+            await self.delete(reg_no)
+            return
+        await self.client.set(self._key(reg_no), json.dumps(state).encode(), ex=ttl)
+
+    async def delete(self, reg_no: str) -> None:
+        await self.client.delete(self._key(reg_no))
+
+    async def purge_expired(self) -> int:
+        return 0
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def make_session_backend() -> SqliteSessionBackend | RedisSessionBackend | None:
+    """
+    build the shared session backend from the environment
+    SESSION_BACKEND : [ "memory", "sqlite", "redis", "local" ]
+    memory keeps sessions in the worker only (None), a single worker is required then.
+    """
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+
+    if backend == "memory":
+        return None
+
+    if backend == "sqlite":
+        logger.info("using sqlite backend for the session store")
+        return SqliteSessionBackend()
+
+    if backend == "redis":
+        url = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+        logger.info("using redis backend for the session store")
+        return RedisSessionBackend(connect_redis(url))
+
+    if backend == "local":
+        logger.info("using embedded local redis stand-in for the session store")
+        return RedisSessionBackend(LocalRedis())
+
+    raise ValueError(f"unknown SESSION_BACKEND : {backend}")
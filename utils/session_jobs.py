@@ -0,0 +1,99 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicSessionJob:
+    """
+    runs `job` for every tracked session once per interval. the first run of each
+    session is at a random offset, so runs are spread over the interval instead of
+    bunching up. a heap of due times drives the schedule, `concurrency` runs at once.
+    a job returning False stops tracking its session.
+    """
+
+    name = "session job"
+
+    def __init__(self, interval: float, concurrency: int):
+        self.interval = interval
+        self.concurrency = concurrency
+        self._heap: list[tuple[float, str]] = []
+        # next due time of every tracked session, heap entries not matching it are stale
+        self._scheduled: dict[str, float] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self.runs = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def track(self, reg_no: str) -> None:
+        if not self.enabled or reg_no in self._scheduled:
+            return
+        due = time.time() + random.uniform(0, self.interval)
+        self._scheduled[reg_no] = due
+        heapq.heappush(self._heap, (due, reg_no))
+        if self._wakeup is not None and self._heap[0] == (due, reg_no):
+            self._wakeup.set()
+
+    def untrack(self, reg_no: str) -> None:
+        self._scheduled.pop(reg_no, None)
+
+    async def job(self, reg_no: str) -> bool:
+        raise NotImplementedError
+
+    async def _run_job(self, reg_no: str) -> None:
+        async with self._semaphore:
+            if reg_no not in self._scheduled:
+                return
+            self.runs += 1
+            try:
+                keep = await self.job(reg_no)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"{self.name} failed for {reg_no} : {e}", exc_info=True)
+                return
+            if not keep:
+                self.untrack(reg_no)
+
+    async def run(self) -> None:
+        """sleep until the next run is due, or until an earlier one is tracked"""
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, reg_no = heapq.heappop(self._heap)
+                if self._scheduled.get(reg_no) != due:
+                    continue
+                self._scheduled[reg_no] = due + self.interval
+                heapq.heappush(self._heap, (due + self.interval, reg_no))
+                task = asyncio.create_task(self._run_job(reg_no))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            self._wakeup.clear()
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "tracked": len(self._scheduled),
+            "runs": self.runs,
+            "errors": self.errors,
+        }
@@ -0,0 +1,172 @@
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# latencies kept per vtop page
+VTOP_TIMEOUT_SAMPLES = int(os.getenv("VTOP_TIMEOUT_SAMPLES", "50"))
+
+# latency percentile a page's timeout is derived from
+VTOP_TIMEOUT_PERCENTILE = float(os.getenv("VTOP_TIMEOUT_PERCENTILE", "0.95"))
+
+# a page's read timeout is this many times its latency percentile
+VTOP_TIMEOUT_MULTIPLIER = float(os.getenv("VTOP_TIMEOUT_MULTIPLIER", "3"))
+
+# lower bound of an adapted read timeout, in seconds
+VTOP_TIMEOUT_MIN = float(os.getenv("VTOP_TIMEOUT_MIN", "2"))
+
+# samples needed before a page's timeout adapts, the client's timeout is used until then
+MIN_SAMPLES = 5
+
+# seconds a whole scrape may take, 0 disables the deadline
+SCRAPE_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "120"))
+
+# timeout field behind each httpx timeout error
+TIMEOUT_FIELDS = {
+    httpx.ConnectTimeout: "connect",
+    httpx.ReadTimeout: "read",
+    httpx.WriteTimeout: "write",
+    httpx.PoolTimeout: "pool",
+}
+
+_deadline: ContextVar[float | None] = ContextVar("scrape_deadline", default=None)
+
+
+class ScrapeDeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def scrape_deadline(seconds: float = SCRAPE_DEADLINE):
+    """vtop requests sent inside the block share a deadline `seconds` from now"""
+    token = _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class LatencyTracker:
+    """rolling latencies per vtop page, and the read timeout derived from them"""
+
+    def __init__(
+        self, samples: int, percentile: float, multiplier: float, floor: float
+    ):
+        self.samples = samples
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.floor = floor
+        self._latencies: dict[str, deque[float]] = {}
+        self.timeouts = 0
+        self.deadline_exceeded = 0
+
+    def record(self, page: str, latency: float) -> None:
+        latencies = self._latencies.get(page)
+        if latencies is None:
+            latencies = self._latencies[page] = deque(maxlen=self.samples)
+        latencies.append(latency)
+
+    def quantile(self, page: str) -> float | None:
+        latencies = self._latencies.get(page)
+        if not latencies or len(latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[
+            min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        ]
+
+    def timeout(self, page: str, ceiling: float | None) -> float | None:
+        """read timeout of the page, never above the client's own timeout"""
+        quantile = self.quantile(page)
+        if quantile is None:
+            return ceiling
+        timeout = max(self.floor, quantile * self.multiplier)
+        return timeout if ceiling is None else min(timeout, ceiling)
+
+    def stats(self) -> dict:
+        return {
+            "timeouts": self.timeouts,
+            "deadline_exceeded": self.deadline_exceeded,
+            "pages": {
+                page: {
+                    "samples": len(latencies),
+                    "quantile": round(self.quantile(page) or 0, 3),
+                    "timeout": round(self.timeout(page, None) or 0, 3),
+                }
+                for page, latencies in self._latencies.items()
+            },
+        }
+
+
+class AdaptiveTimeoutTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport giving each vtop page a read timeout adapted from its observed
+    latency, so a hung request fails in a few multiples of the page's usual latency
+    instead of the full client timeout. every timeout is also cut to what is left of
+    the scrape deadline. a request that times out is recorded at its timeout, so a
+    page that became slower gets a larger timeout on the next requests.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, tracker: LatencyTracker):
+        self.transport = transport
+        self.tracker = tracker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        page = request.url.path
+        timeouts = dict(request.extensions.get("timeout", {}))
+        read = self.tracker.timeout(page, timeouts.get("read"))
+        if read is not None:
+            timeouts["read"] = read
+
+        original = timeouts
+        deadline = _deadline.get()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.tracker.deadline_exceeded += 1
+                raise ScrapeDeadlineExceeded(f"scrape deadline exceeded before {page}")
+            timeouts = {
+                key: remaining if value is None else min(value, remaining)
+                for key, value in timeouts.items()
+            }
+        request.extensions["timeout"] = timeouts
+
+        started = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TimeoutException as e:
+            field = TIMEOUT_FIELDS.get(type(e))
+            if field is not None and timeouts.get(field) != original.get(field):
+                # cut short by the deadline, says nothing about the page or vtop :
+                # not a transport error, so the circuit breaker does not count it
+                self.tracker.deadline_exceeded += 1
+                raise ScrapeDeadlineExceeded(
+                    f"scrape deadline exceeded during {page}"
+                ) from e
+            self.tracker.timeouts += 1
+            if field == "read" and read is not None:
+                self.tracker.record(page, read)
+            raise
+        self.tracker.record(page, time.monotonic() - started)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+vtop_latency = LatencyTracker(
+    VTOP_TIMEOUT_SAMPLES,
+    VTOP_TIMEOUT_PERCENTILE,
+    VTOP_TIMEOUT_MULTIPLIER,
+    VTOP_TIMEOUT_MIN,
+)
@@ -1,20 +1,335 @@
+import asyncio
+import base64
+import heapq
+import itertools
+import json
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 import httpx
+from dotenv import load_dotenv
 from fastapi import HTTPException
 import logging
 import time
 
-logger = logging.getLogger(__name__)
+from utils.circuit_breaker import CircuitBreakerTransport, vtop_breaker
+from utils.timeouts import AdaptiveTimeoutTransport, vtop_latency
+from utils.session_backend import (
+    SessionState,
+    dump_cookies,
+    load_cookies,
+    make_session_backend,
+)
+
+load_dotenv()
 
-sessions = {}
-csrf_store = {}
+logger = logging.getLogger(__name__)
 
 
 SESSION_TIMEOUT = 3600  # session timeout in 1 hour
 
+# session status : client stored, logged in to vtop, dropped by vtop
+CREATED, ACTIVE, EXPIRED = "created", "active", "expired"
+
+# live vtop clients kept at once, the least recently used one is closed beyond this
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+
+# file the memory session store is checkpointed to and reloaded from at startup,
+# unset disables checkpoints. it holds login cookies, it is written with mode 0600
+SESSION_CHECKPOINT_PATH = os.getenv("SESSION_CHECKPOINT_PATH")
+
+# seconds between two checkpoints, unchanged sessions are not written again
+SESSION_CHECKPOINT_INTERVAL = float(os.getenv("SESSION_CHECKPOINT_INTERVAL", "30"))
+
+
+def make_client(cookies: list[dict] | None = None) -> httpx.AsyncClient:
+    """
+    the httpx client of a vtop session, optionally with a dumped cookie jar. its
+    requests go through the vtop circuit breaker, and their read timeout adapts to
+    the latency of each page with the timeout below as the ceiling.
+    """
+    timeout = httpx.Timeout(
+        connect=10.0,  # Connection timeout
+        read=30.0,  # Read timeout (increase this)
+        write=10.0,  # Write timeout
+        pool=10.0,  # Pool timeout
+    )
+    transport = CircuitBreakerTransport(
+        AdaptiveTimeoutTransport(httpx.AsyncHTTPTransport(verify=False), vtop_latency),
+        vtop_breaker,
+    )
+    client = httpx.AsyncClient(
+        transport=transport, follow_redirects=True, timeout=timeout
+    )
+    if cookies:
+        load_cookies(client.cookies, cookies)
+    return client
+
+
+def open_connections(client: httpx.AsyncClient) -> int:
+    """connections held by the client's pool, 0 when the transport has no pool"""
+    transport = client._transport
+    while hasattr(transport, "transport"):
+        transport = transport.transport
+    pool = getattr(transport, "_pool", None)
+    return len(getattr(pool, "connections", ()))
+
+
+class SessionStore:
+    """
+    vtop clients and csrf tokens of the students that are logging in or scraping.
+    every session has one deadline, SESSION_TIMEOUT after its client was stored, and its
+    csrf token expires with it. deadlines are kept in a min heap, the expiry task sleeps
+    until the earliest one, so sessions are dropped on time and each expiry is O(log n).
+    heap entries of sessions deleted or stored again are stale and skipped when popped.
+    at most max_sessions clients are kept, the least recently used one is evicted.
+    every client leaving the store, for any reason, is aclose()d.
+    with a shared session backend this is the worker's copy of the sessions, clients
+    are rebuilt from the shared cookie jar on demand.
+    """
+
+    def __init__(self, timeout: float, max_sessions: int):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, httpx.AsyncClient] = OrderedDict()
+        self.csrf: dict[str, str] = {}
+        # jpeg of the captcha shown for the pending login
+        self.captchas: dict[str, bytes] = {}
+        self.status: dict[str, str] = {}
+        self.deadlines: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._wakeup: asyncio.Event | None = None
+        # clients used by a running scrape, their close waits for it to finish
+        self._holds: dict[httpx.AsyncClient, int] = {}
+        self._close_pending: set[httpx.AsyncClient] = set()
+        self.evictions = 0
+        self.expirations = 0
+        self.closed_clients = 0
+
+    def _schedule(self, reg_no: str, deadline: float | None = None) -> None:
+        deadline = deadline or time.time() + self.timeout
+        self.deadlines[reg_no] = deadline
+        heapq.heappush(self._heap, (deadline, reg_no))
+        self._compact()
+        if self._wakeup is not None and self._heap[0] == (deadline, reg_no):
+            self._wakeup.set()
+
+    def _compact(self) -> None:
+        """rebuild the heap from the live deadlines once stale entries outnumber them"""
+        if len(self._heap) > 2 * len(self.deadlines):
+            self._heap = [
+                (deadline, reg_no) for reg_no, deadline in self.deadlines.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def is_live(self, reg_no: str) -> bool:
+        deadline = self.deadlines.get(reg_no)
+        return deadline is not None and time.time() < deadline
+
+    def get_client(self, reg_no: str) -> httpx.AsyncClient | None:
+        client = self.sessions.get(reg_no)
+        if client is not None:
+            self.sessions.move_to_end(reg_no)
+        return client
+
+    async def close_client(self, client: httpx.AsyncClient | None) -> None:
+        if client is None:
+            return
+        if client in self._holds:
+            self._close_pending.add(client)
+            return
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"error in closing client : {e}")
+        self.closed_clients += 1
+
+    async def store_client(self, reg_no: str, client: httpx.AsyncClient) -> None:
+        """a new client starts a new session, the old client and csrf token are dropped"""
+        previous = self.sessions.pop(reg_no, None)
+        if previous is not client:
+            await self.close_client(previous)
+        self.sessions[reg_no] = client
+        self.csrf.pop(reg_no, None)
+        self.captchas.pop(reg_no, None)
+        self.status[reg_no] = CREATED
+        self._schedule(reg_no)
+        await self._evict(keep=reg_no)
+
+    async def restore(self, reg_no: str, state: SessionState) -> httpx.AsyncClient:
+        """bring the copy of a session up to date with its shared state"""
+        client = self.get_client(reg_no)
+        if client is None:
+            client = make_client()
+            self.sessions[reg_no] = client
+            await self._evict(keep=reg_no)
+        load_cookies(client.cookies, state["cookies"])
+
+        if state["csrf"] is None:
+            self.csrf.pop(reg_no, None)
+        else:
+            self.csrf[reg_no] = state["csrf"]
+        if state.get("captcha") is None:
+            self.captchas.pop(reg_no, None)
+        else:
+            self.captchas[reg_no] = base64.b64decode(state["captcha"])
+        self.status[reg_no] = state.get("status") or CREATED
+        if self.deadlines.get(reg_no) != state["deadline"]:
+            self._schedule(reg_no, state["deadline"])
+        return client
+
+    def state(self, reg_no: str) -> SessionState:
+        client = self.sessions.get(reg_no)
+        captcha = self.captchas.get(reg_no)
+        return {
+            "cookies": dump_cookies(client.cookies) if client is not None else [],
+            "csrf": self.csrf.get(reg_no),
+            "captcha": base64.b64encode(captcha).decode() if captcha else None,
+            "status": self.status.get(reg_no, CREATED),
+            "deadline": self.deadlines[reg_no],
+        }
+
+    @asynccontextmanager
+    async def hold(self, client: httpx.AsyncClient):
+        """keep the client open and out of eviction while the block uses it"""
+        self._holds[client] = self._holds.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            self._holds[client] -= 1
+            if not self._holds[client]:
+                del self._holds[client]
+                if client in self._close_pending:
+                    self._close_pending.discard(client)
+                    await self.close_client(client)
+
+    def _eviction_order(self, keep: str | None = None):
+        """
+        sessions that never logged in first, then logged in ones, each least recently
+        used first. sessions held by a running scrape, and `keep`, are never evicted.
+        """
+        for logged_in in (False, True):
+            for reg_no, client in self.sessions.items():
+                if reg_no == keep or client in self._holds:
+                    continue
+                if (self.status.get(reg_no) != CREATED) == logged_in:
+                    yield reg_no
+
+    async def _evict(self, keep: str | None = None) -> None:
+        excess = len(self.sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        for reg_no in list(itertools.islice(self._eviction_order(keep), excess)):
+            await self.remove(reg_no)
+            self.evictions += 1
+            logger.info(f"{reg_no} session is evicted, store is full")
+
+    def store_csrf(self, reg_no: str, csrf_token: str) -> None:
+        self.csrf[reg_no] = csrf_token
+        if reg_no not in self.deadlines:
+            self._schedule(reg_no)
+
+    async def remove(self, reg_no: str) -> None:
+        client = self.sessions.pop(reg_no, None)
+        self.csrf.pop(reg_no, None)
+        self.captchas.pop(reg_no, None)
+        self.status.pop(reg_no, None)
+        self.deadlines.pop(reg_no, None)
+        self._compact()
+        await self.close_client(client)
+
+    async def expire_due(self) -> list[str]:
+        """drop every session whose deadline has passed, returns their reg_no"""
+        now = time.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, reg_no = heapq.heappop(self._heap)
+            if self.deadlines.get(reg_no) != deadline:
+                continue
+            if reg_no in self.sessions or reg_no in self.csrf:
+                self.expirations += 1
+                expired.append(reg_no)
+            await self.remove(reg_no)
+        return expired
+
+    async def run(self) -> None:
+        """sleep until the earliest deadline, or until an earlier one is scheduled"""
+        self._wakeup = asyncio.Event()
+        while True:
+            for reg_no in await self.expire_due():
+                logger.info(f"{reg_no} session is delete due to timeout")
+
+            self._wakeup.clear()
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        """close every client, called at shutdown"""
+        for reg_no in list(self.sessions):
+            await self.remove(reg_no)
+        self._heap.clear()
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "csrf_tokens": len(self.csrf),
+            "active": sum(status == ACTIVE for status in self.status.values()),
+            "expired": sum(status == EXPIRED for status in self.status.values()),
+            "open_connections": sum(
+                open_connections(client) for client in self.sessions.values()
+            ),
+            "cookies": sum(
+                len(client.cookies.jar) for client in self.sessions.values()
+            ),
+            "cookie_bytes": sum(
+                len(cookie.name) + len(cookie.value or "")
+                for client in self.sessions.values()
+                for cookie in client.cookies.jar
+            ),
+            "heap_entries": len(self._heap),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "closed_clients": self.closed_clients,
+            "held_clients": len(self._holds),
+        }
+
+
+session_store = SessionStore(SESSION_TIMEOUT, SESSION_MAX_SESSIONS)
+
+# None keeps sessions in this worker only
+session_backend = make_session_backend()
+
+
+async def refresh_session(reg_no: str) -> None:
+    """load the shared state of a session into this worker, any worker may have changed it"""
+    if session_backend is None:
+        return
+    state = await session_backend.load(reg_no)
+    if state is None:
+        await session_store.remove(reg_no)
+    else:
+        await session_store.restore(reg_no, state)
+
+
+async def save_session(reg_no: str) -> None:
+    """write the cookie jar, csrf token and deadline of a session to the shared backend"""
+    if session_backend is None or reg_no not in session_store.deadlines:
+        return
+    await session_backend.save(reg_no, session_store.state(reg_no))
+
 
 async def delete_session(reg_no: str) -> None:
     try:
-        del sessions[reg_no]
+        if session_backend is not None:
+            await session_backend.delete(reg_no)
+        client = session_store.sessions.pop(reg_no)
+        session_store.captchas.pop(reg_no, None)
+        session_store.status.pop(reg_no, None)
+        await session_store.close_client(client)
         logger.info("client is deleteed")
     except Exception as e:
         logger.error(f"error in deleting client {reg_no} : error -> {e}")
@@ -23,7 +338,12 @@ async def delete_session(reg_no: str) -> None:
 
 async def delete_csrf_token(reg_no: str) -> None:
     try:
-        del csrf_store[reg_no]
+        if session_backend is not None:
+            await session_backend.delete(reg_no)
+        del session_store.csrf[reg_no]
+        session_store.captchas.pop(reg_no, None)
+        session_store.status.pop(reg_no, None)
+        session_store.deadlines.pop(reg_no, None)
         logger.info("csrf token removed")
     except Exception as e:
         logger.error(f"error in deleting client {reg_no} : error -> {e}")
@@ -32,7 +352,8 @@ async def delete_csrf_token(reg_no: str) -> None:
 
 async def store_client(reg_no: str, client: httpx.AsyncClient) -> None:
     try:
-        sessions[reg_no] = (client, time.time())
+        await session_store.store_client(reg_no, client)
+        await save_session(reg_no)
         logger.info(f"Stored client for reg_no: {reg_no}")
     except Exception as e:
         logger.error(f"Error storing client for reg_no {reg_no}: {e}", exc_info=True)
@@ -41,51 +362,80 @@ async def store_client(reg_no: str, client: httpx.AsyncClient) -> None:
 
 async def get_client(reg_no: str) -> httpx.AsyncClient | None:
     try:
-        entry = sessions[reg_no]
-        if entry:
-            client, timeout = entry
-            if time.time() - timeout <= SESSION_TIMEOUT:
-                return client
-            else:
-                await delete_session(reg_no)
-                logger.error(f"session timeout for {reg_no}")
-                return None
-        if entry is None:
+        await refresh_session(reg_no)
+        client = session_store.get_client(reg_no)
+        if client is None:
             logger.warning(f"No client found for reg_no: {reg_no}")
-        return None
+            return None
+        if not session_store.is_live(reg_no):
+            await session_store.remove(reg_no)
+            logger.error(f"session timeout for {reg_no}")
+            return None
+        return client
     except Exception as e:
         logger.error(f"Error retrieving client for reg_no {reg_no}: {e}", exc_info=True)
         return None
 
 
 async def validate_session(reg_no: str):
-    if reg_no not in sessions:
+    await refresh_session(reg_no)
+    if reg_no not in session_store.sessions:
         logger.error(f"Session does not exist for reg_no: {reg_no}")
         raise HTTPException(401, detail="session does not exist")
+    if session_store.status.get(reg_no) == EXPIRED:
+        logger.error(f"vtop session expired for reg_no: {reg_no}")
+        raise HTTPException(401, detail="vtop session expired, login again")
+
+
+async def set_session_status(reg_no: str, status: str) -> None:
+    if reg_no not in session_store.deadlines:
+        return
+    session_store.status[reg_no] = status
+    await save_session(reg_no)
+
+
+async def get_session_status(reg_no: str) -> tuple[str, float] | None:
+    """status and seconds left of a session, None when there is no live session"""
+    await refresh_session(reg_no)
+    if not session_store.is_live(reg_no):
+        return None
+    deadline = session_store.deadlines[reg_no]
+    return session_store.status.get(reg_no, CREATED), deadline - time.time()
 
 
 async def store_csrf(reg_no: str, csrf_token):
     if csrf_token is None:
         logger.error(f"CSRF token does not exist for reg_no: {reg_no}")
         raise ValueError("csrf_token does not exist")
-    csrf_store[reg_no] = (csrf_token, time.time())
+    session_store.store_csrf(reg_no, csrf_token)
+    await save_session(reg_no)
     logger.info(f"Stored CSRF token for reg_no: {reg_no}")
 
 
+async def store_captcha(reg_no: str, image: bytes) -> None:
+    session_store.captchas[reg_no] = image
+    await save_session(reg_no)
+
+
+async def get_captcha(reg_no: str) -> bytes | None:
+    await refresh_session(reg_no)
+    if not session_store.is_live(reg_no):
+        return None
+    return session_store.captchas.get(reg_no)
+
+
 async def get_csrf(reg_no: str):
     try:
-        entry = csrf_store[reg_no]
-        if entry:
-            csrf, timestamp = entry
-            if time.time() - timestamp <= SESSION_TIMEOUT:
-                return csrf
-            else:
-                await delete_session(reg_no)
-                logger.error("session expire for csrf token")
-                return None
-        else:
+        await refresh_session(reg_no)
+        csrf = session_store.csrf.get(reg_no)
+        if csrf is None:
             logger.warning(f"No CSRF token found for reg_no: {reg_no}")
-        return None
+            return None
+        if not session_store.is_live(reg_no):
+            await session_store.remove(reg_no)
+            logger.error("session expire for csrf token")
+            return None
+        return csrf
     except Exception as e:
         logger.error(
             f"Error retrieving CSRF token for reg_no {reg_no}: {e}", exc_info=True
@@ -93,14 +443,117 @@ async def get_csrf(reg_no: str):
         return None
 
 
-async def cleanup_sessions():
-    now = time.time()
-    expires = [
-        reg_no
-        for reg_no, (_, timeout) in sessions.items()
-        if now - timeout > SESSION_TIMEOUT
-    ]
-    for reg_no in expires:
-        await delete_session(reg_no)
-        await delete_csrf_token(reg_no)
-        logger.info(f"{reg_no} session is delete due to timeout")
+async def expire_sessions():
+    """background task dropping every session, with its csrf token, at its deadline"""
+    await session_store.run()
+
+
+async def purge_expired_sessions() -> None:
+    """drop expired sessions from a shared backend that does not expire them itself"""
+    if session_backend is None:
+        return
+    purged = await session_backend.purge_expired()
+    if purged:
+        logger.info(f"purged {purged} expired shared sessions")
+
+
+async def close_sessions() -> None:
+    """
+    close every client of this worker, shared sessions are kept for the other workers
+    and memory sessions are checkpointed first, for the next process.
+    """
+    if session_checkpoint is not None:
+        try:
+            session_checkpoint.write()
+        except Exception as e:
+            logger.error(f"error in writing session checkpoint : {e}")
+    await session_store.close()
+    if session_backend is not None:
+        await session_backend.close()
+
+
+class SessionCheckpoint:
+    """
+    checkpoints of the memory session store (cookie jars, csrf tokens, deadlines) to a
+    json file, so a restart does not log every student out. shared backends already
+    outlive the process and are not checkpointed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._written: str | None = None
+        self.checkpoints = 0
+
+    def snapshot(self) -> str:
+        now = time.time()
+        return json.dumps(
+            {
+                reg_no: session_store.state(reg_no)
+                for reg_no, deadline in session_store.deadlines.items()
+                if deadline > now
+            }
+        )
+
+    def write(self) -> None:
+        data = self.snapshot()
+        if data == self._written:
+            return
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        self._written = data
+        self.checkpoints += 1
+
+    async def load(self) -> int:
+        """restore the sessions of the last checkpoint, expired ones are skipped"""
+        try:
+            with open(self.path) as f:
+                data = f.read()
+            states = json.loads(data)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.error(f"error in reading session checkpoint {self.path} : {e}")
+            return 0
+
+        now = time.time()
+        restored = 0
+        for reg_no, state in states.items():
+            if state["deadline"] <= now:
+                continue
+            await session_store.restore(reg_no, state)
+            restored += 1
+        self._written = data
+        return restored
+
+    async def run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.error(f"error in writing session checkpoint {self.path} : {e}")
+
+
+session_checkpoint = (
+    SessionCheckpoint(SESSION_CHECKPOINT_PATH)
+    if SESSION_CHECKPOINT_PATH and session_backend is None
+    else None
+)
+
+
+async def restore_sessions() -> None:
+    """reload the sessions checkpointed by the previous process, called at startup"""
+    if session_checkpoint is None:
+        return
+    restored = await session_checkpoint.load()
+    logger.info(f"restored {restored} sessions from {session_checkpoint.path}")
+
+
+async def checkpoint_sessions() -> None:
+    """background task writing the session checkpoint every SESSION_CHECKPOINT_INTERVAL"""
+    if session_checkpoint is None:
+        return
+    await session_checkpoint.run(SESSION_CHECKPOINT_INTERVAL)